@@ -15,6 +15,7 @@ import coloredlogs
 # project modules
 from dorcas.brain import Brain
 from dorcas.database import *
+from dorcas.worker.pins import use_pins
 
 log = logging.getLogger(__name__)
 
@@ -29,6 +30,12 @@ log = logging.getLogger(__name__)
     "If none is specified, the hostname will be used as the config name.",
 )
 @click.option("--debug", "-D", count=True, help="Produce more diagnostic output.")
+@click.option(
+    "--firehose",
+    "-F",
+    is_flag=True,
+    help="Subscribe to all MQTT topics (#) rather than just those which responders and musings use.",
+)
 @click.option(
     "--list-config", "-l", is_flag=True, help="List available configs and exit"
 )
@@ -38,9 +45,17 @@ log = logging.getLogger(__name__)
 @click.option(
     "--no-publish", "-p", is_flag=True, help="Do not publish activity on MQTT"
 )
+@click.option(
+    "--pins",
+    type=click.Choice(["pigpio", "simulated"]),
+    default="pigpio",
+    envvar="DORCAS_PINS",
+    show_default=True,
+    help="How to drive the GPIO pins. simulated doesn't need pigpiod (or the hardware).",
+)
 @click.option("--quiet", "-q", count=True, help="Produce less diagnostic output.")
 @click.option("--verbose", "-v", is_flag=True, help="Be more verbose.")
-def main(config, debug, list_config, log_path, no_publish, quiet, verbose):
+def main(config, debug, firehose, list_config, log_path, no_publish, pins, quiet, verbose):
     # simpler, more compact logging
     fmt = "%(message)s"
     if log_path is not None:
@@ -66,6 +81,7 @@ def main(config, debug, list_config, log_path, no_publish, quiet, verbose):
                 print(rec.id)
         sys.exit(0)
 
+    use_pins(pins)
     [signal(x, sig_halt) for x in [SIGTERM, SIGHUP, SIGINT]]
     signal(SIGUSR1, sig_set_debug)
     signal(SIGUSR2, sig_clear_debug)
@@ -74,7 +90,7 @@ def main(config, debug, list_config, log_path, no_publish, quiet, verbose):
         log.info(
             f"config selected from hostname: {config} ; use --config option to over-ride."
         )
-    Brain(config, mute_mqtt=no_publish).run()
+    Brain(config, mute_mqtt=no_publish, firehose=firehose).run()
     log.info("END")
 
 
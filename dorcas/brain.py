@@ -1,6 +1,7 @@
 # Build-in modules
-from collections import deque
 import logging
+from collections import ChainMap
+from types import MappingProxyType
 import sys
 import os
 import time
@@ -12,11 +13,15 @@ import random
 from singleton_decorator import singleton
 
 # Project modules
+from dorcas.content import Content
+from dorcas.intake import Intake
 from dorcas.sensation import Sensation
+from dorcas.timers import Timers
+from dorcas.topictrie import TopicTrie, minimal_topic_filters
 from dorcas.sense.mqtt import Mqtt
 from dorcas.sense.journal import Journal
 from dorcas.sense.time import Cronoception, duration_to_str
-from dorcas.sense.door import Doorception
+from dorcas.sense.content import Contentception
 
 from dorcas.responder.security import Security
 from dorcas.responder.time import Time
@@ -33,6 +38,7 @@ from dorcas.worker.audio import Audio
 from dorcas.worker.thespian import Thespian
 from dorcas.worker.eyes import Eyes
 from dorcas.worker.alien import Alien
+from dorcas.worker.rehearsal import Rehearsal
 from dorcas.database import DB
 
 log = logging.getLogger(__name__)
@@ -45,17 +51,35 @@ class Brain:
     MaxQueuedSensations = 30
     PoliteTimeout = 60
 
-    def __init__(self, config, mute_mqtt):
+    # MQTT topic filters for other things which talk, so we can be polite (see update_polite)
+    PoliteTopics = [
+        "+/talking",
+        "+/said",
+        "+/+/talking",
+        "+/+/said",
+        "+/+/+/talking",
+        "+/+/+/said",
+    ]
+
+    def __init__(self, config, mute_mqtt, firehose=False):
         self.config = DB().config(config)
         self._state = {
             "mute_mqtt": mute_mqtt,
+            "firehose": firehose,
             "arrival": False,
             "yakkers": {},
         }
+        self._version = 0
+        self._snapshot = (None, None)
         self.set_silence(self.config.mute_switch)
+        # a plain copy, so other threads needn't touch the config record (and so the database session)
+        self.set("default_voice", self.config.voice_id)
         log.info(f"using config {config} ==> {self.config}")
         assert self.config
-        self.sensations = deque()
+        self.sensations = Intake(self.intake_classes(), self.MaxQueuedSensations)
+        self.halt = False
+        # one-shot and periodic calls for senses and responders (started in run)
+        self.timers = Timers()
 
         # Config some singletons with self
         self.workers = [
@@ -65,6 +89,7 @@ class Brain:
             Thespian(self),
             Eyes(self),
             Alien(self),
+            Rehearsal(self),
         ]
 
         self.responders = [
@@ -77,12 +102,15 @@ class Brain:
             DoorMonitor(self),
             MuteSwitch(self),
         ]
+        self.dispatch = None
+        self.rebuild_dispatch()
+        Content().add_listener(self.rebuild_dispatch)
 
         self.senses = [
             Mqtt(self),  # primary sense of the world is via MQTT
             Journal(self),  # watch system logs for interesting activity
             Cronoception(self),  # notice the passage of time
-            Doorception(self),  # notice open doors
+            Contentception(self),  # notice changes to the content database
         ]
 
         self.set("boot_time", arrow.now())
@@ -93,6 +121,31 @@ class Brain:
         self._state["random"] = random.random()
         return self._state
 
+    def snapshot(self):
+        """A frozen, read-only copy of the state, shared by everyone until the next set().
+
+        Dict values (e.g. doors) are wrapped in read-only proxies rather than copied."""
+        version, snapshot = self._snapshot
+        if version != self._version:
+            version = self._version
+            state = dict(self._state)
+            snapshot = MappingProxyType(
+                {k: MappingProxyType(v) if type(v) is dict else v for k, v in state.items()}
+            )
+            self._snapshot = (version, snapshot)
+        return snapshot
+
+    def view(self, overlay=None):
+        """A layered view of the state for conditions and actions.
+
+        Values in overlay hide those in the state. Writes to the view land in the overlay, and never
+        reach the Brain's state, so views may be handed out without copying anything."""
+        volatile = {
+            "uptime": (arrow.now() - self._state["boot_time"]).seconds,
+            "random": random.random(),
+        }
+        return ChainMap({} if overlay is None else overlay, volatile, self.snapshot())
+
     def uptime(self):
         return duration_to_str(arrow.now() - self.get("boot_time"))
 
@@ -103,18 +156,35 @@ class Brain:
     def set(self, var, value, overwrite=True, diagnostic_level=logging.DEBUG):
         old = self._state.get(var)
         self._state[var] = value
+        self._version += 1
         log.log(diagnostic_level, f"Brain.set {var}={value} (old={old})")
         return old
 
     def experience(self, sensation):
         self.update_polite(sensation.topic)
-        if len(self.sensations) < self.MaxQueuedSensations:
-            self.sensations.append(sensation)
-        else:
+        if not self.sensations.put(sensation):
             log.warning(f"overstimulated! (drop: {sensation!r})")
 
     def stop(self):
         self.halt = True
+        self.sensations.close()
+
+    def intake_classes(self):
+        """Priority classes for the sensation queue - see Intake"""
+        return [
+            (
+                Intake.Urgent,
+                [
+                    "nh/gk/entry_announce/#",
+                    "nh/gk/+/DoorState",
+                    "nh/gk/LastManState",
+                    "nh/status/req",
+                    self.topic("os/#"),
+                    self.topic("content/reload"),
+                ],
+            ),
+            (Intake.Coalesce, ["nh/temperature/#"]),
+        ]
 
     def run(self):
         """A blocking function that runs the show"""
@@ -123,14 +193,17 @@ class Brain:
         }
         MqttClient().publish("nh/status/res", f"Restart: {self.config.instrument_id}")
         self.handle_sensation(Sensation(self.topic("start"), json.dumps(start_message)))
+        self.timers.start()
         for thing in self.workers + self.senses:
             thing.start()
 
-        self.halt = False
         while not self.halt:
-            while len(self.sensations) > 0:
-                self.handle_sensation(self.sensations.popleft())
-            time.sleep(self.get("tick_time", 0.5))
+            # blocks until a sense experiences something, or stop() is called
+            sensation = self.sensations.get()
+            if sensation is None:
+                break
+            self.handle_sensation(sensation)
+        log.info(f"sensation intake: {self.sensations.stats()}")
         stop_message = {
             "system_time": str(self.get("boot_time")),
             "uptime_text": self.uptime(),
@@ -149,22 +222,56 @@ class Brain:
         log.debug("waiting for things to stop")
         for sense in self.senses + self.workers:
             thing.wait()
+        self.timers.stop()
+        self.timers.wait()
 
         log.debug("Brain.run END")
 
     def handle_sensation(self, sensation):
+        if sensation.topic == self.topic("content/reload"):
+            self.reload_content()
         urges = list()
         if sensation.topic.startswith("nh/donationbot/"):
             log.info(f"sense: {sensation}")
         else:
             log.debug(f"sense: {sensation}")
-        for responder in self.responders:
+        for responder in self.dispatch.match(sensation.topic):
             urges.extend(responder(sensation))
         # TODO: be more sophisticated about this.  For now, just perform the most urgent one
         if len(urges) > 0:
             selection = sorted(urges, key=lambda x: x.priority, reverse=True)[0]
             selection.perform()
 
+    def reload_content(self):
+        """Reload the content indexes. Only call this from the Brain's thread, which owns the
+        database session."""
+        if not Content().changed():
+            return
+        log.info("content database changed; reloading")
+        try:
+            Content().reload()
+            self.set("default_voice", self.config.voice_id)
+        except:
+            log.error("Content reload problem", exc_info=True)
+
+    def rebuild_dispatch(self):
+        """Index responders by the topic filters they declare, for handle_sensation"""
+        dispatch = TopicTrie()
+        for responder in self.responders:
+            for topic_filter in responder.topics():
+                dispatch.add(topic_filter, responder)
+        log.debug(f"dispatch: {len(dispatch)} topic filters for {len(self.responders)} responders")
+        self.dispatch = dispatch
+
+    def subscriptions(self):
+        """The minimal list of MQTT topic filters needed to feed the responders"""
+        if self.get("firehose"):
+            return ["#"]
+        filters = list(self.PoliteTopics)
+        for responder in self.responders:
+            filters.extend(responder.topics())
+        return minimal_topic_filters(filters)
+
     def door_ids(self):
         return [x for x in self._state.keys() if x.startswith("door_")]
 
@@ -173,8 +280,11 @@ class Brain:
         log.info(f"set_silence({new})")
         self._state["silence"] = new
         self._state["last_utterance"] = None
+        self._version += 1
         self.config.mute_switch = new
+        before = Content().file_signature()
         DB().session.commit()
+        Content().committed(before)
 
     def update_polite(self, topic):
         if topic.startswith(self.config.mqtt_prefix + "/"):
@@ -0,0 +1,56 @@
+# Built-in modules
+import logging
+import threading
+
+# PIP-installed modules
+from cachetools import LRUCache
+from singleton_decorator import singleton
+
+
+log = logging.getLogger(__name__)
+
+
+@singleton
+class CodeCache:
+    """A bounded LRU cache of code objects for condition and action source text.
+
+    The same few hundred condition and action strings are evaluated over and over, so parsing and
+    compiling them each time is a waste. The cache is cleared when the content database is reloaded.
+    """
+
+    MaxSize = 1024
+
+    def __init__(self, maxsize=MaxSize):
+        self.lock = threading.Lock()
+        self.cache = LRUCache(maxsize=maxsize)
+        self.hits = 0
+        self.misses = 0
+
+    def compile(self, source, mode):
+        """Returns a code object for source, compiled with mode "eval" or "exec".
+
+        Raises the same exceptions as the built-in compile() for bad source."""
+        key = (source, mode)
+        with self.lock:
+            code = self.cache.get(key)
+            if code is not None:
+                self.hits += 1
+                return code
+            self.misses += 1
+        code = compile(source, "<string>", mode)
+        with self.lock:
+            self.cache[key] = code
+        return code
+
+    def clear(self):
+        with self.lock:
+            log.debug(f"CodeCache.clear {self.stats()}")
+            self.cache.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.cache),
+            "maxsize": self.cache.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
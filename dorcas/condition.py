@@ -3,7 +3,11 @@ import sys
 import os
 import logging
 import random
-import copy
+import types
+from collections import ChainMap
+
+# Project modules
+from dorcas.codecache import CodeCache
 
 log = logging.getLogger(__name__)
 
@@ -16,7 +20,7 @@ FunctionMap = {
 
 def check_condition(expr):
     try:
-        compile(expr, "<string>", "eval")
+        CodeCache().compile(expr, "eval")
         return True
     except Exception as e:
         log.error(f"condition does not compile: {expr!r}")
@@ -24,13 +28,13 @@ def check_condition(expr):
 
 
 def evaluate_condition(expr, context, id):
+    """expr may be a string or a code object compiled in "eval" mode"""
     try:
         if expr is None:
             return False
-        context = {} if context is None else copy.copy(context)
-        for k, v in FunctionMap.items():
-            context[k] = v
-        code = compile(expr, "<string>", "eval")
+        # the empty top layer catches any assignment (e.g. :=) so the context is never modified
+        context = ChainMap({}, FunctionMap, {} if context is None else context)
+        code = expr if type(expr) is types.CodeType else CodeCache().compile(expr, "eval")
         return eval(code, {}, context)
     except Exception as e:
         log.error(f"failed to evaluate condition for {id}", exc_info=True)
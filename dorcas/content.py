@@ -0,0 +1,223 @@
+# Built-in modules
+import ast
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+
+# PIP-installed modules
+from singleton_decorator import singleton
+
+# Project modules
+from dorcas.codecache import CodeCache
+from dorcas.database import *
+
+
+log = logging.getLogger(__name__)
+
+
+class IgnoreMatcher:
+    """Decides which MQTT messages to ignore, using rules from the ignores table.
+
+    A message is ignored if the topic matches a rule's topic_re and the message matches the same
+    rule's message_re. Rules sharing a topic regex are grouped, and the topic regexes are combined
+    into one alternation, so finding the candidate message regexes for a topic costs a single regex
+    match no matter how many rules there are. If the topic regexes can't be combined (e.g. they
+    contain groups, which would upset numbering), the groups are checked one by one.
+
+    As with checking the rules one at a time, the first matching rule (in the order given) wins.
+    """
+
+    def __init__(self, rules):
+        """rules is a list of (id, topic_re, message_re) tuples"""
+        self.rules = tuple(rules)
+        self.hits = {x[0]: 0 for x in self.rules}
+        groups = dict()
+        for index, (id, topic_re, message_re) in enumerate(self.rules):
+            try:
+                trx = re.compile(topic_re)
+                mrx = re.compile(message_re)
+            except re.error as e:
+                log.error(f"Ignore #{id} bad regex, skipping: {e}")
+                continue
+            groups.setdefault(topic_re, (trx, list()))[1].append((index, id, mrx))
+        self.groups = list(groups.values())
+        self.combined = None
+        if len(self.groups) > 0 and all([trx.groups == 0 for trx, _ in self.groups]):
+            try:
+                self.combined = re.compile("|".join([f"({x})" for x in groups.keys()]))
+            except re.error as e:
+                log.warning(f"IgnoreMatcher: can't combine topic regexes: {e}")
+
+    def match(self, topic, message):
+        """Returns the id of the rule which matches, or None"""
+        start = 0
+        if self.combined is not None:
+            m = self.combined.match(topic)
+            if m is None:
+                return None
+            # m.lastindex is the first group whose topic regex matches
+            start = m.lastindex - 1
+        # groups before start don't match the topic, later ones might, and may hold earlier rules
+        best = None  # (index, id)
+        for n in range(start, len(self.groups)):
+            trx, rules = self.groups[n]
+            if (self.combined is None or n > start) and not trx.match(topic):
+                continue
+            for index, id, mrx in rules:
+                if best is not None and index > best[0]:
+                    break
+                if mrx.match(message):
+                    best = (index, id)
+                    break
+        if best is None:
+            return None
+        self.hits[best[1]] += 1
+        return best[1]
+
+
+def constant_says(program):
+    """Returns a list of (text, voice_id) for calls to say() with constant arguments in an action
+    program. voice_id is None if the default voice is used."""
+    says = list()
+    try:
+        tree = ast.parse(program)
+    except SyntaxError:
+        return says
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "say"):
+            continue
+        args = list(node.args)
+        voice = None
+        for kw in node.keywords:
+            if kw.arg == "voice":
+                voice = kw.value
+            elif kw.arg == "text":
+                args.insert(0, kw.value)
+        if len(args) > 1:
+            voice = args[1]
+        if len(args) == 0 or not isinstance(args[0], ast.Constant) or type(args[0].value) is not str:
+            continue
+        if voice is not None and not (isinstance(voice, ast.Constant) and type(voice.value) is str):
+            continue
+        says.append((args[0].value, None if voice is None else voice.value))
+    return says
+
+
+@singleton
+class Content:
+    """In-memory indexes of the content database, for things which are consulted on every sensation.
+
+    The indexes are rebuilt by reload(), which replaces each one in a single assignment so readers in
+    other threads see either the old or the new index, never a half-built one. reload() uses the
+    shared database session, so it's only called from the Brain's thread (see Brain.reload_content).
+    Functions registered with add_listener() are called after each reload, in that thread.
+    """
+
+    CompiledMusing = namedtuple("CompiledMusing", ["id", "weight", "action", "condition"])
+    # plain copies of voice and effect rows, with the same attributes, safe to use in any thread
+    VoiceRow = namedtuple("VoiceRow", ["id", "engine", "voice", "pitch", "amplitude", "speed", "gap", "effect"])
+    EffectRow = namedtuple("EffectRow", ["id", "args"])
+
+    def __init__(self):
+        log.info(f"{self.__class__.__name__}.__init__")
+        self.lock = threading.Lock()
+        self.listeners = list()
+        self.signature = None
+        self.musings = dict()
+        self.voices = dict()
+        self.journal_matchers = tuple()
+        self.says = tuple()
+        self.ignores = IgnoreMatcher([])
+        self.reload()
+
+    def add_listener(self, fn):
+        self.listeners.append(fn)
+
+    def file_signature(self):
+        """Something which changes whenever the database file is written or replaced"""
+        try:
+            st = os.stat(DB().path)
+            return (st.st_ino, st.st_size, st.st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+    def changed(self):
+        return self.file_signature() != self.signature
+
+    def committed(self, before):
+        """Call after this process commits to the database, with the file_signature() from just
+        before, so its own writes don't look like new content. If the file had already changed
+        (e.g. database.py load), it's left to be noticed."""
+        if before == self.signature:
+            self.signature = self.file_signature()
+
+    def reload(self):
+        with self.lock:
+            self.signature = self.file_signature()
+            # make sure the session re-reads records changed by other processes (e.g. database.py load)
+            DB().session.expire_all()
+            # greetings and musings may have changed, so there's no point keeping old code around
+            CodeCache().clear()
+            self.musings = self.load_musings()
+            self.voices = self.load_voices()
+            self.journal_matchers = self.load_journal_matchers()
+            self.says = self.load_says()
+            ignores = self.load_ignores()
+            if ignores != self.ignores.rules:
+                # only rebuild when the rules change, so hit counts survive other edits
+                self.ignores = IgnoreMatcher(ignores)
+        log.info(f"Content.reload: {sum([len(x) for x in self.musings.values()])} musings for {len(self.musings)} topics")
+        for fn in self.listeners:
+            try:
+                fn()
+            except Exception as e:
+                log.exception(f"Content.reload listener {fn!r}")
+
+    def load_ignores(self):
+        """Returns a tuple of (id, topic_re, message_re)"""
+        return tuple(
+            [(x.id, x.topic_re, x.message_re) for x in DB().session.query(Ignore).order_by(Ignore.id).all()]
+        )
+
+    def load_voices(self):
+        """Returns a dict of id: VoiceRow"""
+        effects = {x.id: self.EffectRow(x.id, x.args) for x in DB().session.query(Effect).all()}
+        return {
+            x.id: self.VoiceRow(
+                x.id, x.engine, x.voice, x.pitch, x.amplitude, x.speed, x.gap, effects.get(x.effect_id)
+            )
+            for x in DB().session.query(Voice).all()
+        }
+
+    def load_journal_matchers(self):
+        """Returns a tuple of (identifier, regex, prefix, sub_topic)"""
+        return tuple(
+            [
+                (x.identifier, x.regex, x.prefix, x.sub_topic)
+                for x in DB().session.query(JournalMatcher).order_by(JournalMatcher.id).all()
+            ]
+        )
+
+    def load_says(self):
+        """Returns a tuple of (text, voice_id) for constant say() calls in greeting and musing actions"""
+        says = list()
+        for entity in (Greeting, Musing):
+            for rec in DB().session.query(entity).order_by(entity.id).all():
+                says.extend(constant_says(rec.action))
+        return tuple(says)
+
+    def load_musings(self):
+        """Returns a dict of topic: (CompiledMusing, ...)"""
+        index = dict()
+        for rec in DB().session.query(Musing).order_by(Musing.id).all():
+            id = f"Musing #{rec.id}"
+            try:
+                action = CodeCache().compile(rec.action, "exec")
+                condition = None if rec.condition is None else CodeCache().compile(rec.condition, "eval")
+            except Exception as e:
+                log.error(f"{id} does not compile, skipping: {e}")
+                continue
+            index.setdefault(rec.topic, list()).append(self.CompiledMusing(id, rec.weight, action, condition))
+        return {k: tuple(v) for k, v in index.items()}
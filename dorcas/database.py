@@ -132,6 +132,22 @@ class Musing(Base):
         return f"Musing(action={self.action!r}, topic={self.topic!r}, condition={self.condition!r}, weight={self.weight!r})"
 
 
+class JournalMatcher(Base):
+    """Makes sensations from system journal messages. Only messages from programs with the given
+    SYSLOG_IDENTIFIER are read at all. Messages which start with prefix (if not NULL) and match
+    regex make a sensation on sub_topic, with the regex's named groups as JSON fields."""
+
+    __tablename__ = "journal_matchers"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    identifier = Column(String, nullable=False, index=True)
+    regex = Column(String, nullable=False)
+    prefix = Column(String, nullable=True)
+    sub_topic = Column(String, nullable=False)
+
+    def __repr__(self):
+        return f"JournalMatcher(identifier={self.identifier!r}, regex={self.regex!r}, prefix={self.prefix!r}, sub_topic={self.sub_topic!r})"
+
+
 @singleton
 class DB:
     def __init__(self, path, debug):
@@ -140,6 +156,9 @@ class DB:
         self.session = None
         if not os.path.exists(path):
             self.create_new_database()
+        else:
+            # add any tables which are newer than the database
+            Base.metadata.create_all(bind=self.engine)
         self.create_session()
 
     def create_new_database(self):
@@ -221,6 +240,10 @@ if __name__ == "__main__":
         log.info("load_musings")
         load_generic(Musing, sheet, ["id"])
 
+    def load_journal_matchers(sheet):
+        log.info("load_journal_matchers")
+        load_generic(JournalMatcher, sheet, ["id"])
+
     def load_generic(tclass, sheet, excludes):
         # excludes these auto fields
         sheet_name = sheet.find(gnm("Name")).text
@@ -309,6 +332,7 @@ if __name__ == "__main__":
             "special_days",
             "greetings",
             "musings",
+            "journal_matchers",
         )
         if len(tables) == 0:
             tables = known_tables
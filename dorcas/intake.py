@@ -0,0 +1,100 @@
+# Built-in modules
+import logging
+import threading
+from collections import deque
+
+# Project modules
+from dorcas.topictrie import TopicTrie
+
+
+log = logging.getLogger(__name__)
+
+
+class Intake:
+    """A bounded, blocking queue of sensations, with priority classes.
+
+    Each sensation is put in a class by its topic:
+
+    - Urgent sensations (e.g. someone at the door) are always served first, and are never dropped
+      to make way for anything else.
+    - Normal sensations are served in order, and new ones are dropped if the queue is full.
+    - Coalesced sensations (e.g. temperature readings) keep only the latest value for each topic,
+      and are served after everything else.
+
+    The condition uses a re-entrant lock, so close() may be called from a signal handler.
+    """
+
+    Urgent = "urgent"
+    Normal = "normal"
+    Coalesce = "coalesce"
+
+    def __init__(self, classes, limit):
+        """classes is a list of (class, [topic_filter, ...]), the first matching class is used"""
+        self.limit = limit
+        self.classes = TopicTrie()
+        for cls, filters in classes:
+            assert cls in (self.Urgent, self.Normal, self.Coalesce), f"bad intake class: {cls!r}"
+            for topic_filter in filters:
+                self.classes.add(topic_filter, cls)
+        self.cond = threading.Condition()
+        self.urgent = deque()
+        self.normal = deque()
+        self.latest = dict()  # topic: sensation, in order of first arrival
+        self.closed = False
+        self.counts = {
+            x: {"queued": 0, "dropped": 0, "coalesced": 0} for x in (self.Urgent, self.Normal, self.Coalesce)
+        }
+
+    def __len__(self):
+        return len(self.urgent) + len(self.normal) + len(self.latest)
+
+    def classify(self, topic):
+        match = self.classes.match(topic)
+        return match[0] if len(match) > 0 else self.Normal
+
+    def put(self, sensation):
+        """Queue a sensation (non-blocking). Returns False if it was dropped."""
+        cls = self.classify(sensation.topic)
+        counts = self.counts[cls]
+        with self.cond:
+            if cls == self.Coalesce:
+                if sensation.topic in self.latest:
+                    counts["coalesced"] += 1
+                elif len(self.latest) >= self.limit:
+                    counts["dropped"] += 1
+                    return False
+                self.latest[sensation.topic] = sensation
+            else:
+                queue = self.urgent if cls == self.Urgent else self.normal
+                # urgent sensations get more room, but a flood of them must not eat all the memory
+                if len(queue) >= (self.limit * 4 if cls == self.Urgent else self.limit):
+                    counts["dropped"] += 1
+                    return False
+                queue.append(sensation)
+            counts["queued"] += 1
+            self.cond.notify()
+        return True
+
+    def get(self):
+        """Blocks until there is a sensation, and returns it. Returns None once close() is called."""
+        with self.cond:
+            while not self.closed:
+                if len(self.urgent) > 0:
+                    return self.urgent.popleft()
+                if len(self.normal) > 0:
+                    return self.normal.popleft()
+                if len(self.latest) > 0:
+                    topic = next(iter(self.latest))
+                    return self.latest.pop(topic)
+                self.cond.wait()
+            return None
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+
+    def stats(self):
+        """Returns a dict of class: counts"""
+        with self.cond:
+            return {k: dict(v) for k, v in self.counts.items()}
@@ -0,0 +1,22 @@
+# Built-in modules
+import os
+
+
+def cache_dir(*parts):
+    """Path to a directory under $DORCAS_CACHE_DIR (default ~/.cache/dorcas), created if needed.
+    Things here can be made again, so may be deleted at any time."""
+    base = os.environ.get("DORCAS_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "dorcas"))
+    return make_dir(base, *parts)
+
+
+def state_dir(*parts):
+    """Path to a directory under $DORCAS_STATE_DIR (default ~/.local/state/dorcas), created if
+    needed. For things which should survive restarts, and can't be made again."""
+    base = os.environ.get("DORCAS_STATE_DIR", os.path.join(os.path.expanduser("~"), ".local", "state", "dorcas"))
+    return make_dir(base, *parts)
+
+
+def make_dir(*parts):
+    path = os.path.join(*parts)
+    os.makedirs(path, exist_ok=True)
+    return path
@@ -0,0 +1,98 @@
+# Built-in modules
+import logging
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# PIP-installed modules
+from singleton_decorator import singleton
+import cachetools
+
+
+log = logging.getLogger(__name__)
+
+
+@singleton
+class Resolver:
+    """Reverse DNS lookups which don't hold up the caller.
+
+    Results are cached, failures too (for less time). Lookups are done by a small pool of threads,
+    and there's only ever one lookup in flight for an address however many times it's asked for.
+
+    The first Resolver() call must pass the brain's timers, which are used for deadlines.
+    """
+
+    MaxWorkers = 2
+    # Addresses being looked up at once, beyond which lookups fail straight away
+    MaxPending = 64
+    CacheSize = 1024
+    PositiveTTL = 3600
+    NegativeTTL = 300
+
+    def __init__(self, timers):
+        log.info(f"{self.__class__.__name__}.__init__")
+        self.timers = timers
+        self.lock = threading.Lock()
+        self.positive = cachetools.TTLCache(maxsize=self.CacheSize, ttl=self.PositiveTTL)
+        self.negative = cachetools.TTLCache(maxsize=self.CacheSize, ttl=self.NegativeTTL)
+        self.inflight = set()
+        self.waiting = dict()  # ip: [callback, ...]
+        self.deadlines = dict()  # ip: TimerHandle
+        self.pool = ThreadPoolExecutor(max_workers=self.MaxWorkers, thread_name_prefix="resolver")
+
+    def cached(self, ip):
+        """Returns (True, hostname or None) if there's a cached result for ip, else (False, None)"""
+        if ip in self.positive:
+            return True, self.positive[ip]
+        if ip in self.negative:
+            return True, None
+        return False, None
+
+    def resolve(self, ip, callback, deadline=None):
+        """Look up the hostname for ip, and call callback exactly once with it (or None if it
+        couldn't be found). If the result is cached, callback is called straight away (in this
+        thread), otherwise from another thread when the lookup finishes, or after deadline seconds,
+        whichever comes first."""
+        with self.lock:
+            found, hostname = self.cached(ip)
+            if not found and ip not in self.inflight and len(self.inflight) >= self.MaxPending:
+                log.debug(f"Resolver: too many lookups pending, not looking up {ip}")
+                found = True
+            if not found:
+                if ip not in self.inflight:
+                    self.inflight.add(ip)
+                    self.pool.submit(self.lookup, ip)
+                if ip not in self.waiting and deadline is not None:
+                    self.deadlines[ip] = self.timers.call_later(
+                        deadline, self.deliver, ip, None, name=f"Resolver.deadline {ip}"
+                    )
+                self.waiting.setdefault(ip, list()).append(callback)
+                return
+        callback(hostname)
+
+    def lookup(self, ip):
+        try:
+            hostname = socket.gethostbyaddr(ip)[0]
+        except (OSError, UnicodeError) as e:
+            log.debug(f"Resolver: {ip}: {e}")
+            hostname = None
+        with self.lock:
+            self.inflight.discard(ip)
+            if hostname is None:
+                self.negative[ip] = True
+            else:
+                self.positive[ip] = hostname
+        self.deliver(ip, hostname)
+
+    def deliver(self, ip, hostname):
+        """Call everyone waiting for ip (if they haven't already been called)"""
+        with self.lock:
+            callbacks = self.waiting.pop(ip, list())
+            timer = self.deadlines.pop(ip, None)
+        if timer is not None:
+            timer.cancel()
+        for callback in callbacks:
+            try:
+                callback(hostname)
+            except Exception as e:
+                log.exception(f"Resolver: callback for {ip}")
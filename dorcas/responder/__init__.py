@@ -9,11 +9,22 @@ log = logging.getLogger(__name__)
 
 
 class Responder(ABC):
-    """Experiences Sensations, produces Urges."""
+    """Experiences Sensations, produces Urges.
+
+    The Brain only calls a responder for sensations with a topic that matches one of the MQTT
+    topic filters returned by topics(). Derived classes with a fixed set of filters can just
+    override Topics.
+    """
+
+    Topics = ("#",)
 
     def __init__(self, brain):
         self.brain = brain
 
+    def topics(self):
+        """Returns a list of MQTT topic filters (which may use + and # wildcards)."""
+        return list(self.Topics)
+
     @abstractmethod
     def __call__(self, sensation):
         """Returns a list of Urge objects."""
@@ -3,6 +3,7 @@ import os
 import sys
 import logging
 import re
+import threading
 
 # PIP-installed modules
 import arrow
@@ -17,14 +18,60 @@ log = logging.getLogger(__name__)
 
 
 class DoorMonitor(Responder):
-    """This responder records when the front door has been open and closed, and sets brain state"""
+    """This responder records when the front door has been open and closed, and sets brain state.
 
+    While a door in RemindDoors is open, a timer makes a door-left-open sensation every
+    door_open_seconds, up to Reminders times. Reminders run on the timers thread, so changes to
+    door state are made under the lock, and a reminder only acts if it's still the current one.
+    """
+
+    Topics = ("nh/gk/+/DoorState",)
     TopicRx = re.compile(r"nh/gk/(\d+)/DoorState$")
     MessageRx = re.compile(r"(OPEN|CLOSED|LOCKED)$")
+    RemindDoors = ("door_1",)
+    Reminders = 2
 
     def __init__(self, brain):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
+        self.lock = threading.Lock()
+        self.reminders = dict()  # state_id: (token, TimerHandle)
+
+    def remind(self, state_id, token):
+        with self.lock:
+            if self.reminders.get(state_id, (None,))[0] is not token:
+                # the door was closed (or opened again) since this reminder was due
+                return
+            door = self.brain.get(state_id)
+            if not door or not door["open"] or door["notifications_left"] <= 0:
+                self.cancel_reminder(state_id)
+                return
+            now = arrow.now()
+            time_open = duration_to_str(now - door["open_since"])
+            self.brain.experience(
+                Sensation(
+                    self.brain.topic("door-left-open"),
+                    f"{door['name']} has been open for {time_open}",
+                )
+            )
+            notifications_left = door["notifications_left"] - 1
+            self.brain.set(state_id, dict(door, last_notified=now, notifications_left=notifications_left))
+            if notifications_left <= 0:
+                self.cancel_reminder(state_id)
+
+    def cancel_reminder(self, state_id):
+        """Must be called with the lock held"""
+        token, timer = self.reminders.pop(state_id, (None, None))
+        if timer is not None:
+            timer.cancel()
+
+    def schedule_reminder(self, state_id):
+        """Must be called with the lock held"""
+        token = object()
+        timer = self.brain.timers.call_every(
+            self.brain.config.door_open_seconds, self.remind, state_id, token, name=f"DoorMonitor.remind {state_id}"
+        )
+        self.reminders[state_id] = (token, timer)
 
     def __call__(self, sensation):
         m = DoorMonitor.TopicRx.match(sensation.topic)
@@ -45,6 +92,12 @@ class DoorMonitor(Responder):
 
         # update the state based on the event details
         now = arrow.now()
+        with self.lock:
+            self.update(state_id, state, door_name, now)
+        return []
+
+    def update(self, state_id, state, door_name, now):
+        """Must be called with the lock held"""
         if state == "OPEN":
             self.brain.set(
                 state_id,
@@ -53,10 +106,14 @@ class DoorMonitor(Responder):
                     "open": True,
                     "open_since": now,
                     "last_notified": now,
-                    "notifications_left": 2,
+                    "notifications_left": self.Reminders,
                 },
             )
+            self.cancel_reminder(state_id)
+            if state_id in self.RemindDoors:
+                self.schedule_reminder(state_id)
         elif state in ("CLOSED", "LOCKED"):
+            self.cancel_reminder(state_id)
             self.brain.set(
                 state_id,
                 {
@@ -67,4 +124,3 @@ class DoorMonitor(Responder):
                     "notifications_left": 0,
                 },
             )
-        return []
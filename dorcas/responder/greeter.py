@@ -1,6 +1,5 @@
 import re
 import datetime
-import copy
 import random
 from collections import namedtuple
 
@@ -22,6 +21,7 @@ class Greeter(Responder):
     """Produces one verbal greeting for members entering via the Door."""
 
     TopicFilter = "nh/gk/entry_announce/known"
+    Topics = (TopicFilter,)
     CandidateGreeting = namedtuple("CandidateGreeting", ["id", "weight", "action"])
     AgoPeriods = [
         (re.compile(r"(\d+)d"), 3600 * 24),
@@ -38,11 +38,14 @@ class Greeter(Responder):
             return []
 
         # 2. create augmented state with name of person who has arrived and so on
-        state = copy.copy(self.brain.state)
         m = re.match(r"Door opened by: (.*) \(last seen (.*) ago\)", sensation.message)
         if m:
-            state["member_name"] = m.group(1)
-            state["absense_message"] = self.get_absense_message(m.group(2))
+            state = self.brain.view(
+                {
+                    "member_name": m.group(1),
+                    "absense_message": self.get_absense_message(m.group(2)),
+                }
+            )
         else:
             log.warning(
                 f"Greeter message regex failed to match for {sensation.message!r}"
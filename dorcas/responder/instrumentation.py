@@ -11,6 +11,8 @@ log = logging.getLogger(__name__)
 
 
 class Instrumentation(Responder):
+    Topics = ("nh/status/req",)
+
     def __init__(self, brain):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
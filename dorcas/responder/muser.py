@@ -1,9 +1,9 @@
-import copy
 import random
 from collections import namedtuple
 
 # Project modules
 from dorcas.condition import evaluate_condition
+from dorcas.content import Content
 from dorcas.responder import Responder
 from dorcas.database import *
 from dorcas.urge import Urge
@@ -18,26 +18,35 @@ class Muser(Responder):
 
     """General reactions to events."""
 
+    DoorTopic = "nh/gk/1/DoorState"
+
+    def topics(self):
+        topics = set(Content().musings.keys())
+        topics.add(self.DoorTopic)
+        return sorted(topics)
+
     def __call__(self, sensation):
+        musings = Content().musings.get(sensation.topic, ())
+
+        # cancel arrivals when the door closes - after evaluating conditions, which may refer to arrival
+        cancel_arrival = sensation.topic == self.DoorTopic and sensation.message == "LOCKED"
+        if len(musings) == 0:
+            if cancel_arrival:
+                self.brain.set("arrival", False)
+            return []
+
         # 1. create augmented state, extracting details from message
         state = self.augmented_state(sensation)
 
-        # 2. filter list of musings from database by condition
+        # 2. filter list of musings for this topic by condition
         candidates = list()
-        for id, rec in [
-            (f"Musing #{x.id}", x)
-            for x in DB()
-            .session.query(Musing)
-            .filter(Musing.topic == sensation.topic)
-            .all()
-        ]:
-            if self.want(rec.condition, state, id):
-                candidate = self.CandidateMusing(id, rec.weight, rec.action)
+        for rec in musings:
+            if self.want(rec.condition, state, rec.id):
+                candidate = self.CandidateMusing(rec.id, rec.weight, rec.action)
                 log.debug(f"adding candidate {candidate}")
                 candidates.append(candidate)
 
-        # cancel arrivals when the door closes
-        if sensation.topic == "nh/gk/1/DoorState" and sensation.message == "LOCKED":
+        if cancel_arrival:
             self.brain.set("arrival", False)
 
         log.debug(f"Muser: {len(candidates)} candidates to choose from")
@@ -56,14 +65,11 @@ class Muser(Responder):
         return [urge]
 
     def augmented_state(self, sensation):
-        state = copy.copy(self.brain.state)
-        state["topic"] = sensation.topic
-        state["message"] = sensation.message
+        overlay = {"topic": sensation.topic, "message": sensation.message}
         data = sensation.json
         if type(data) is dict:
-            for k, v in sensation.json.items():
-                state[k] = v
-        return state
+            overlay.update(data)
+        return self.brain.view(overlay)
 
     def want(self, condition, state, id):
         if condition is None:
@@ -2,7 +2,6 @@
 import os
 import sys
 import logging
-from threading import Timer
 
 # Project modules
 from dorcas.responder import Responder
@@ -20,6 +19,10 @@ class MuteSwitch(Responder):
     the db.
     """
 
+    Topics = ("nh/gk/LastManState",)
+    # Seconds after "Last Out" before actually going silent
+    MuteDelay = 5
+
     def __init__(self, brain):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
@@ -31,11 +34,15 @@ class MuteSwitch(Responder):
 
         if sensation.message == "Last Out":
             self.brain.experience(Sensation(self.brain.topic("silence"), "yes"))
-            self.timer = Timer(5, lambda: self.brain.set_silence(True))
-            self.timer.start()
+            if self.timer is not None:
+                self.timer.cancel()
+            self.timer = self.brain.timers.call_later(
+                self.MuteDelay, self.brain.set_silence, True, name="MuteSwitch.mute"
+            )
         if sensation.message == "First In":
             if self.timer is not None:
                 self.timer.cancel()
+                self.timer = None
             self.brain.set_silence(False)
             self.brain.experience(Sensation(self.brain.topic("silence"), "no"))
 
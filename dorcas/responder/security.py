@@ -14,6 +14,9 @@ class Security(Responder):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
 
+    def topics(self):
+        return [self.brain.topic("os/portscan")]
+
     def __call__(self, sensation):
         urges = list()
         try:
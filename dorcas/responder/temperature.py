@@ -11,6 +11,8 @@ log = logging.getLogger(__name__)
 class Temperature(Responder):
     """This responder doesn't create and urges, but updates the brain state with the temperature of each room, and the median temp"""
 
+    Topics = ("nh/temperature/#",)
+
     def __init__(self, brain):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
@@ -15,6 +15,9 @@ class Time(Responder):
         log.info(f"Responder {self.__class__.__name__}.__init__")
         super().__init__(brain)
 
+    def topics(self):
+        return [self.brain.topic("time/now")]
+
     def __call__(self, sensation):
         urges = list()
         if sensation.topic != self.brain.topic("time/now"):
@@ -28,18 +31,26 @@ class Time(Responder):
             log.exception(f"while responding to the time: {sensation}")
         return urges
 
-    def on_the_hour(self, hour):
+    @staticmethod
+    def bongs(hour):
         bongs = hour % 12
-        if bongs == 0:
-            bongs = 12
+        return 12 if bongs == 0 else bongs
+
+    @staticmethod
+    def hour_text(hour):
+        """What to say on the hour"""
         if hour == 0:
-            text = f"It's mid night. I should go to bed."
+            return f"It's mid night. I should go to bed."
         elif hour == 12:
-            text = f"It mid day. What's for dinner?"
+            return f"It mid day. What's for dinner?"
         elif hour == 18:
-            text = f"It's 6 o clock, what's for tea?"
+            return f"It's 6 o clock, what's for tea?"
         else:
-            text = f"It's {bongs} o clock."
+            return f"It's {Time.bongs(hour)} o clock."
+
+    def on_the_hour(self, hour):
+        bongs = self.bongs(hour)
+        text = self.hour_text(hour)
         program = f"for _ in range({bongs}):\n"
         program += f"    play('cuckoo_chime.wav', bg=True)\n"
         program += f"    alien_show(0.25)\n"
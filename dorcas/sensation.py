@@ -2,25 +2,67 @@
 import logging
 import sys
 import os
-import arrow
 import json
 
+# Use a faster JSON parser if one is installed
+try:
+    import orjson
+
+    json_loads = orjson.loads
+    JSONDecodeError = orjson.JSONDecodeError
+except ImportError:
+    json_loads = json.loads
+    JSONDecodeError = json.decoder.JSONDecodeError
+
 
 log = logging.getLogger(__name__)
 
 
 class Sensation:
+    """A topic and message, e.g. from MQTT.
+
+    Sensations are created for every MQTT message, so they're kept cheap: the message may be given
+    as raw bytes and is only decoded when needed, and the message is parsed as JSON at most once."""
+
+    __slots__ = ("topic", "_payload", "_message", "_json")
+
+    # Marks lazily computed attributes which haven't been computed yet
+    Unset = object()
+
     def __init__(self, topic, message):
-        self.received = arrow.now()
         self.topic = topic
-        self.message = message.decode(errors="ignore") if type(message) is bytes else str(message)
+        if type(message) is bytes:
+            self._payload = message
+            self._message = self.Unset
+        else:
+            self._payload = None
+            self._message = str(message)
+        self._json = self.Unset
+
+    @property
+    def message(self):
+        if self._message is self.Unset:
+            self._message = self._payload.decode(errors="ignore")
+        return self._message
+
+    @property
+    def payload(self):
+        """The message as bytes"""
+        if self._payload is None:
+            self._payload = self._message.encode()
+        return self._payload
 
     @property
     def json(self):
-        try:
-            return json.loads(self.message)
-        except json.decoder.JSONDecodeError:
-            return {}
+        """The message parsed as JSON, or {} if it isn't valid JSON.
+
+        The result is shared by everyone who asks for it, so don't modify it."""
+        if self._json is self.Unset:
+            try:
+                self._json = json_loads(self.payload if self._message is self.Unset else self._message)
+            except (JSONDecodeError, ValueError):
+                self._json = {}
+        return self._json
 
     def __str__(self):
         s = self.topic + " "
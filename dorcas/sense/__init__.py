@@ -43,6 +43,7 @@ class ThreadedHalterSense(Sense):
         super().__init__(brain)
         self.thread = None
         self.halt = None
+        self.wakeup = threading.Event()
 
     @abstractmethod
     def run(self):
@@ -55,11 +56,17 @@ class ThreadedHalterSense(Sense):
             return False
         self.thread = threading.Thread(target=self.run)
         self.halt = False
+        self.wakeup.clear()
         self.thread.start()
 
     def stop(self):
         log.debug(f"{self.__class__.__name__}.stop")
         self.halt = True
+        self.wakeup.set()
+
+    def sleep(self, seconds):
+        """Like time.sleep(), but returns early (with True) if the sense is stopped"""
+        return self.wakeup.wait(seconds)
 
     def wait(self):
         # wait for thread
@@ -0,0 +1,45 @@
+# Built-in python modules
+import logging
+
+# Project modules
+from dorcas.content import Content
+from dorcas.sensation import Sensation
+from dorcas.sense import Sense
+
+
+log = logging.getLogger(__name__)
+
+
+class Contentception(Sense):
+    """Notices when the content database file changes (e.g. after database.py load). Checks are
+    made every interval seconds on the brain's timers.
+
+    This only makes a content/reload sensation: the Brain reloads the content when it handles it,
+    because the reload uses the database session, which belongs to the Brain's thread."""
+
+    def __init__(self, brain):
+        super().__init__(brain)
+        self.interval = 5.0
+        self.timer = None
+        self.noticed = None
+
+    def start(self):
+        log.debug("Contentception.start")
+        self.timer = self.brain.timers.call_every(self.interval, self.tick, name="Contentception.tick")
+
+    def stop(self):
+        log.debug("Contentception.stop")
+        if self.timer is not None:
+            self.timer.cancel()
+
+    def wait(self):
+        pass
+
+    def tick(self):
+        signature = Content().file_signature()
+        if signature == Content().signature or signature == self.noticed:
+            return
+        # only once per change, however long the Brain takes to get round to it
+        self.noticed = signature
+        log.info("content database changed")
+        self.experience(Sensation(self.brain.topic("content/reload"), "database changed"))
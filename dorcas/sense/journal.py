@@ -9,72 +9,135 @@ import select
 import subprocess as sp
 
 # Project modules
-from dorcas.sensation import Sensation
+from dorcas.content import Content
+from dorcas.paths import state_dir
+from dorcas.resolver import Resolver
+from dorcas.sensation import JSONDecodeError, Sensation, json_loads
 from dorcas.sense import ThreadedHalterSense
 
 
 log = logging.getLogger(__name__)
 
 
-def ip_to_hostname(ip):
-    try:
-        p = sp.run(["dig", "-x", str(ip)], capture_output=True)
-        hostname = (
-            [x for x in p.stdout.decode(errors="ignore").splitlines() if re.match(r"[0-9]", x)][0]
-            .split()[-1]
-            .rstrip(".")
-        )
-        assert len(hostname) > 0
-        return hostname
-    except:
-        return "unknown"
+def entry_field(entry, name):
+    """A journal entry field as a string (binary fields come as lists of byte values)"""
+    value = entry.get(name, "")
+    if isinstance(value, list):
+        value = bytes(value).decode(errors="ignore")
+    return str(value)
 
 
 class Journal(ThreadedHalterSense):
-    """The Journal Sense monitors the system journal (log), creating events when it sees certain log messages"""
-
-    Matchers = [
-        (
-            re.compile(r"Accepted (\S+) for (\S+) from (\S+) "),
-            "os/login",
-            lambda m: json.dumps(
-                {
-                    "method": m.group(1),
-                    "user": m.group(2),
-                    "from": m.group(3),
-                    "from_hostname": ip_to_hostname(m.group(3)),
-                }
-            ),
-        ),
-        (
-            re.compile(r"scanlogd\[\d+\]: (\S+) to (\S+) "),
-            "os/portscan",
-            lambda m: json.dumps(
-                {
-                    "to": m.group(2),
-                    "from": m.group(1),
-                    "from_hostname": ip_to_hostname(m.group(1)),
-                }
-            ),
-        ),
-    ]
+    """The Journal Sense monitors the system journal (log), creating events when it sees certain log messages
+
+    Where a message has a "from" address, the sensation gets a "from_hostname" too. That's looked
+    up by the Resolver, and the sensation is experienced when the lookup finishes (or after
+    ResolveDeadline seconds, with "unknown"), so the journal keeps being read meanwhile.
+
+    The journal is read as JSON records, as soon as they arrive. The cursor of the last record seen
+    is saved (under state_dir()), so after a restart reading picks up where it left off. If
+    journalctl won't start from the saved cursor (e.g. the journal has been rotated or vacuumed
+    away), the cursor is dropped and reading starts from now.
+
+    Matchers come from the journal_matchers table. journalctl is only asked for messages from the
+    programs (SYSLOG_IDENTIFIERs) they name, and a message must start with a matcher's literal
+    prefix before its regex is tried.
+    """
+
+    ResolveDeadline = 1.0
+
+    # Used if the journal_matchers table is empty: (identifier, regex, prefix, sub_topic)
+    DefaultMatchers = (
+        ("sshd", r"Accepted (?P<method>\S+) for (?P<user>\S+) from (?P<from>\S+) ", "Accepted ", "os/login"),
+        ("sshd-session", r"Accepted (?P<method>\S+) for (?P<user>\S+) from (?P<from>\S+) ", "Accepted ", "os/login"),
+        ("scanlogd", r"(?P<from>\S+) to (?P<to>\S+) ", None, "os/portscan"),
+    )
+
+    # Don't make sensations from entries older than this (seconds) when catching up after a restart
+    MaxAge = 600
+    # Save the cursor at most this often (seconds), and when stopping
+    CursorSaveInterval = 5.0
 
     def __init__(self, brain):
         super().__init__(brain)
-        self.cmd = ["journalctl", "-f", "--since", "now"]
         self.p = None
-        self.poll = None
-        self.interval = self.brain.config.journal_interval
+        self.from_cursor = None  # the cursor journalctl was started with
+        self.received = 0  # bytes read since journalctl was started
+        self.matchers = dict()  # identifier: [(prefix, regex, sub_topic), ...]
+        # configure the singleton
+        Resolver(brain.timers)
+        self.reload = True
+        Content().add_listener(self.content_changed)
+        self.cursor_path = os.path.join(state_dir("journal"), "cursor")
+        self.cursor = self.load_cursor()
+        self.saved_cursor = self.cursor
+        self.last_save = time.monotonic()
+
+    def load_cursor(self):
+        try:
+            with open(self.cursor_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def save_cursor(self):
+        if self.cursor is None or self.cursor == self.saved_cursor:
+            return
+        tmp = f"{self.cursor_path}.tmp"
+        with open(tmp, "w") as f:
+            f.write(self.cursor)
+        os.replace(tmp, self.cursor_path)
+        self.saved_cursor = self.cursor
+        self.last_save = time.monotonic()
+
+    def content_changed(self):
+        self.reload = True
+
+    def load_matchers(self):
+        rows = Content().journal_matchers
+        if len(rows) == 0:
+            rows = self.DefaultMatchers
+        matchers = dict()
+        for identifier, regex, prefix, sub_topic in rows:
+            try:
+                rx = re.compile(regex)
+            except re.error as e:
+                log.error(f"Journal matcher for {identifier} {regex!r} bad regex, skipping: {e}")
+                continue
+            matchers.setdefault(identifier, list()).append((prefix or "", rx, sub_topic))
+        return matchers
+
+    def make_cmd(self):
+        cmd = ["journalctl", "--follow", "--output", "json"]
+        # several matches on the same field mean any of them
+        cmd.extend([f"SYSLOG_IDENTIFIER={x}" for x in sorted(self.matchers.keys())])
+        if self.cursor is None:
+            cmd.extend(["--since", "now"])
+        else:
+            # pick up from the last entry seen, including anything logged while we weren't running
+            cmd.extend(["--after-cursor", self.cursor, "--no-tail"])
+        return cmd
 
     def start_subprocess(self):
         if self.p:
             log.warning("Journal.start_subprocess: already present")
             return False
-        self.p = sp.Popen(self.cmd, stdout=sp.PIPE, stderr=sp.PIPE, bufsize=0)
-        self.poll = select.poll()
-        self.poll.register(self.p.stdout)
+        cmd = self.make_cmd()
+        log.debug(f"Journal.start_subprocess: {cmd}")
+        self.p = sp.Popen(cmd, stdout=sp.PIPE, stderr=sp.DEVNULL, bufsize=0)
+        self.from_cursor = self.cursor
+        self.received = 0
         return True
 
+    def subprocess_ended(self):
+        status = self.p.wait()
+        self.p = None
+        if status != 0 and self.from_cursor is not None and self.received == 0:
+            log.warning(f"journalctl exited with status {status} starting after the saved cursor; starting from now")
+            self.cursor = None
+        else:
+            log.warning(f"journalctl exited with status {status}; restarting")
+
     def stop_subprocess(self):
         if self.p:
             self.p.terminate()
@@ -82,25 +145,77 @@ class Journal(ThreadedHalterSense):
             status = self.p.wait()
             log.debug(f"Journal.stop_subprocess: subprocess ended with {status}")
             self.p = None
-            self.poll = None
 
     def run(self):
         log.debug("Journal.run")
-        self.start_subprocess()
+        partial = b""
         while not self.halt:
-            while self.poll.poll(1) and not self.halt:
-                line = self.p.stdout.readline()
-                if len(line) > 0:
-                    self.process_log_entry(line.decode(errors="ignore"))
-            time.sleep(self.interval)
+            if self.reload:
+                self.reload = False
+                matchers = self.load_matchers()
+                if matchers.keys() != self.matchers.keys():
+                    # journalctl needs to be asked for a different set of programs
+                    self.stop_subprocess()
+                self.matchers = matchers
+            if len(self.matchers) == 0:
+                self.sleep(1.0)
+                continue
+            if self.p is None:
+                self.start_subprocess()
+                partial = b""
+            # block until there's something to read (waking now and then to check for halt)
+            ready, _, _ = select.select([self.p.stdout], [], [], 1.0)
+            if ready:
+                data = os.read(self.p.stdout.fileno(), 65536)
+                if len(data) == 0:
+                    self.subprocess_ended()
+                    self.sleep(1.0)
+                    continue
+                self.received += len(data)
+                lines = (partial + data).split(b"\n")
+                partial = lines.pop()
+                self.process_batch(lines)
+            if time.monotonic() - self.last_save >= self.CursorSaveInterval:
+                self.save_cursor()
         log.debug("Journal.main loop ended")
         self.stop_subprocess()
+        self.save_cursor()
         log.debug("Journal.run END")
 
-    def process_log_entry(self, line):
-        for rx, sub_topic, fn in Journal.Matchers:
-            m = rx.search(line)
+    def process_batch(self, lines):
+        """Process a batch of journal records (JSON, one per line)"""
+        oldest = (time.time() - self.MaxAge) * 1000000
+        for line in lines:
+            try:
+                entry = json_loads(line)
+            except (JSONDecodeError, ValueError):
+                continue
+            self.cursor = entry.get("__CURSOR", self.cursor)
+            try:
+                if int(entry.get("__REALTIME_TIMESTAMP", 0)) < oldest:
+                    continue
+            except ValueError:
+                pass
+            self.process_log_entry(entry_field(entry, "SYSLOG_IDENTIFIER"), entry_field(entry, "MESSAGE"))
+
+    def process_log_entry(self, identifier, message):
+        for prefix, rx, sub_topic in self.matchers.get(identifier, ()):
+            if not message.startswith(prefix):
+                continue
+            m = rx.search(message)
             if m:
-                log.debug(f"got a match sub_topic={sub_topic} {line!r}")
-                self.experience(Sensation(self.brain.topic(sub_topic), fn(m)))
+                log.debug(f"got a match sub_topic={sub_topic} {identifier}: {message!r}")
+                fields = {k: v for k, v in m.groupdict().items() if v is not None}
+                self.experience_with_hostname(self.brain.topic(sub_topic), fields)
                 return
+
+    def experience_with_hostname(self, topic, fields):
+        if "from" not in fields:
+            self.experience(Sensation(topic, json.dumps(fields)))
+            return
+
+        def resolved(hostname):
+            fields["from_hostname"] = "unknown" if hostname is None else hostname
+            self.experience(Sensation(topic, json.dumps(fields)))
+
+        Resolver().resolve(fields["from"], resolved, deadline=self.ResolveDeadline)
@@ -1,4 +1,5 @@
 # Built-in python modules
+import math
 import time
 import json
 import datetime
@@ -12,15 +13,28 @@ from sqlalchemy import or_, and_
 
 # Project modules
 from dorcas.sensation import Sensation
-from dorcas.sense import ThreadedHalterSense
+from dorcas.sense import Sense
 from dorcas.database import *
 
 
 log = logging.getLogger(__name__)
 
 
-class Cronoception(ThreadedHalterSense):
-    """The Time Sense annouces the passing of time, including details of special days."""
+class Cronoception(Sense):
+    """The Time Sense annouces the passing of time, including details of special days.
+
+    Nothing polls: ticks are scheduled on the brain's timers for the start of each minute by the
+    wall clock (timers take care of clock jumps and suspend/resume), and becoming bored is a timer
+    of its own.
+
+    Boredom: once boredom_minimum seconds have passed since the last utterance, the chance of
+    becoming bored is boredom_amount per time_interval seconds. Rather than rolling dice every
+    time_interval, the time to become bored is drawn from the equivalent exponential distribution.
+    Each tick checks whether something has been said since, and if so reschedules it.
+    """
+
+    # How long after the minute boundary (seconds) to tick, so it's certainly the new minute
+    TickLate = 0.01
 
     WeekdayNames = {
         0: "Monday",
@@ -53,6 +67,9 @@ class Cronoception(ThreadedHalterSense):
         self.special_day = None
         self.last_date = None
         self.last_minute = None
+        self.bored_since = None
+        self.tick_timer = None
+        self.boredom_timer = None
 
     @property
     @cachetools.func.ttl_cache(ttl=23)
@@ -66,30 +83,62 @@ class Cronoception(ThreadedHalterSense):
     def door_open_time(self):
         return self.brain.config.door_open_time
 
-    def run(self):
-        log.debug("Cronoception.run")
-        while not self.halt:
-            self.tick(arrow.now().datetime)
-            time.sleep(self.interval)
-        log.debug("Cronoception.run END")
+    def start(self):
+        log.debug("Cronoception.start")
+        self.tick_timer = self.brain.timers.call_later(0, self.tick, name="Cronoception.tick")
+
+    def stop(self):
+        log.debug("Cronoception.stop")
+        for timer in (self.tick_timer, self.boredom_timer):
+            if timer is not None:
+                timer.cancel()
 
-    def tick(self, now):
-        self.boredom(now)
+    def wait(self):
+        pass
+
+    def tick(self):
+        now = arrow.now().datetime
+        next_minute = (time.time() // 60 + 1) * 60 + self.TickLate
+        self.tick_timer = self.brain.timers.call_at(next_minute, self.tick, name="Cronoception.tick")
+        self.schedule_boredom()
         if now.minute == self.last_minute:
             return
         self.last_minute = now.minute
         self.clock(now)
 
-    def boredom(self, now):
-        # Boredom
+    def schedule_boredom(self):
+        """(Re)schedule becoming bored if something has been said since it was last scheduled"""
         last_utterance = self.brain.get("last_utterance")
-        if last_utterance is not None:
-            seconds_since_utterance = (arrow.now() - last_utterance).seconds
-            if seconds_since_utterance > self.boredom_settings.min:
-                if random.random() < self.boredom_settings.amt:
-                    self.brain.experience(
-                        Sensation(self.brain.topic("bored"), seconds_since_utterance)
-                    )
+        if last_utterance == self.bored_since:
+            return
+        self.bored_since = last_utterance
+        if self.boredom_timer is not None:
+            self.boredom_timer.cancel()
+            self.boredom_timer = None
+        if last_utterance is None:
+            return
+        self.set_boredom_timer(last_utterance.timestamp() + self.boredom_settings.min + self.boredom_wait())
+
+    def set_boredom_timer(self, when):
+        if when != math.inf:
+            self.boredom_timer = self.brain.timers.call_at(when, self.boredom, name="Cronoception.boredom")
+
+    def boredom_wait(self):
+        """Random seconds to wait before becoming bored (once the minimum has passed)"""
+        rate = self.boredom_settings.amt / self.interval
+        return random.expovariate(rate) if rate > 0 else math.inf
+
+    def boredom(self):
+        self.boredom_timer = None
+        since = self.bored_since
+        self.schedule_boredom()
+        if since is None or self.bored_since != since:
+            # something was said (or silence set) since this was scheduled
+            return
+        seconds_since_utterance = int(time.time() - self.bored_since.timestamp())
+        self.brain.experience(Sensation(self.brain.topic("bored"), seconds_since_utterance))
+        # in case becoming bored doesn't lead to saying something
+        self.set_boredom_timer(time.time() + self.boredom_wait())
 
     def clock(self, now):
         self.update_date(now.date())
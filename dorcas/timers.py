@@ -0,0 +1,180 @@
+# Built-in modules
+import heapq
+import itertools
+import logging
+import threading
+import time
+
+
+log = logging.getLogger(__name__)
+
+
+class TimerHandle:
+    """A scheduled call, as returned by Timers.call_later / call_every / call_at. Cancel with cancel()."""
+
+    def __init__(self, fn, args, name, interval=None, wall=None):
+        self.fn = fn
+        self.args = args
+        self.name = name or getattr(fn, "__qualname__", repr(fn))
+        self.interval = interval  # seconds, for periodic timers
+        self.wall = wall  # wall-clock time (seconds since the epoch), for call_at timers
+        self.deadline = None  # monotonic time of the next call
+        self.cancelled = False
+        self.calls = 0
+
+    def cancel(self):
+        self.cancelled = True
+
+    @property
+    def pending(self):
+        return not self.cancelled and self.deadline is not None
+
+    def __repr__(self):
+        return f"TimerHandle({self.name!r}, deadline={self.deadline}, interval={self.interval})"
+
+
+class Timers:
+    """One thread which makes calls at scheduled times, for senses and responders which would
+    otherwise poll or start a threading.Timer of their own.
+
+    Timers are kept in a heap ordered by (monotonic) deadline, and the thread sleeps until the
+    earliest is due, or something earlier is scheduled. Cancelled timers are dropped from the heap
+    when they come to the top.
+
+    call_at timers are for wall-clock times (e.g. the start of the next minute). Their deadlines
+    are recomputed if the wall clock jumps (NTP, or resuming after suspend), and while any are
+    pending, the thread wakes at least every MaxSleep seconds to notice such jumps.
+
+    Calls are made from the timer thread, so they should be quick - anything slow should be
+    handed to a worker, or experienced as a sensation.
+    """
+
+    MaxSleep = 10.0
+    # Change (seconds) in the difference between the wall and monotonic clocks that counts as a jump
+    JumpTolerance = 1.0
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = list()  # (deadline, seq, handle)
+        self.seq = itertools.count()
+        self.wall_timers = 0
+        self.offset = time.time() - time.monotonic()
+        self.thread = None
+        self.halt = False
+
+    def start(self):
+        if self.thread:
+            log.error("Timers.start: thread already running")
+            return False
+        self.halt = False
+        self.thread = threading.Thread(target=self.run, name="timers", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self):
+        with self.cond:
+            self.halt = True
+            self.cond.notify()
+
+    def wait(self):
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+
+    def schedule(self, handle, deadline):
+        with self.cond:
+            handle.deadline = deadline
+            heapq.heappush(self.heap, (deadline, next(self.seq), handle))
+            if handle.wall is not None:
+                self.wall_timers += 1
+            if self.heap[0][2] is handle:
+                self.cond.notify()
+        return handle
+
+    def call_later(self, delay, fn, *args, name=None):
+        """Call fn(*args) once, after delay seconds"""
+        return self.schedule(TimerHandle(fn, args, name), time.monotonic() + max(0.0, delay))
+
+    def call_every(self, interval, fn, *args, name=None, first=None):
+        """Call fn(*args) every interval seconds, the first time after first seconds (default
+        interval). Calls don't drift, and if they fall behind, missed calls are skipped."""
+        assert interval > 0, f"bad interval: {interval}"
+        handle = TimerHandle(fn, args, name, interval=interval)
+        return self.schedule(handle, time.monotonic() + (interval if first is None else max(0.0, first)))
+
+    def call_at(self, when, fn, *args, name=None):
+        """Call fn(*args) once, at wall-clock time when (seconds since the epoch)"""
+        handle = TimerHandle(fn, args, name, wall=when)
+        return self.schedule(handle, when - (time.time() - time.monotonic()))
+
+    def pending(self):
+        """[(name, seconds until due, interval), ...] for timers not yet cancelled, soonest first"""
+        now = time.monotonic()
+        with self.cond:
+            entries = sorted(x for x in self.heap if x[2].pending)
+        return [(h.name, deadline - now, h.interval) for deadline, _, h in entries]
+
+    def check_jump(self):
+        """Recompute the deadlines of call_at timers if the wall clock has jumped. Must be called
+        with the lock held."""
+        offset = time.time() - time.monotonic()
+        jump = offset - self.offset
+        self.offset = offset
+        if abs(jump) <= self.JumpTolerance:
+            return
+        log.info(f"Timers: wall clock moved {jump:+.1f}s (clock change or resume)")
+        if self.wall_timers == 0:
+            return
+        heap = list()
+        for deadline, seq, handle in self.heap:
+            if handle.wall is not None:
+                deadline = handle.wall - offset
+                handle.deadline = deadline
+            heap.append((deadline, seq, handle))
+        heapq.heapify(heap)
+        self.heap = heap
+
+    def next_due(self):
+        """Pop and return the next handle which is due, or None after waiting for a while. Must be
+        called with the lock held."""
+        self.check_jump()
+        while self.heap and self.heap[0][2].cancelled:
+            self.pop()
+        timeout = self.MaxSleep if self.wall_timers > 0 else None
+        if self.heap:
+            delay = self.heap[0][0] - time.monotonic()
+            if delay <= 0:
+                return self.pop()
+            timeout = delay if timeout is None else min(delay, timeout)
+        self.cond.wait(timeout)
+        return None
+
+    def pop(self):
+        _, _, handle = heapq.heappop(self.heap)
+        if handle.wall is not None:
+            self.wall_timers -= 1
+        return handle
+
+    def run(self):
+        log.debug("Timers.run")
+        while True:
+            with self.cond:
+                if self.halt:
+                    break
+                handle = self.next_due()
+            if handle is None:
+                continue
+            deadline = handle.deadline
+            handle.deadline = None
+            handle.calls += 1
+            try:
+                handle.fn(*handle.args)
+            except Exception:
+                log.exception(f"Timers: {handle.name} failed")
+            if handle.interval is not None and not handle.cancelled:
+                now = time.monotonic()
+                deadline += handle.interval
+                if deadline < now:
+                    deadline = now + handle.interval
+                self.schedule(handle, deadline)
+        log.debug("Timers.run END")
@@ -0,0 +1,112 @@
+# Built-in modules
+import logging
+
+
+log = logging.getLogger(__name__)
+
+
+class TopicTrie:
+    """Maps MQTT topic filters (which may contain + and # wildcards) to values.
+
+    match() returns the values of every filter which matches a topic, in the order the filters
+    were added. Results are memoized per topic, since the same few hundred topics are seen over and
+    over again on the broker.
+    """
+
+    MaxMemo = 4096
+
+    class Node:
+        __slots__ = ("children", "values", "rest")
+
+        def __init__(self):
+            self.children = dict()
+            self.values = list()  # (order, value) for filters ending at this node
+            self.rest = list()  # (order, value) for filters ending with # at this node
+
+    def __init__(self):
+        self.root = TopicTrie.Node()
+        self.count = 0
+        self.memo = dict()
+
+    def __len__(self):
+        return self.count
+
+    def add(self, topic_filter, value):
+        assert type(topic_filter) is str and len(topic_filter) > 0, f"bad topic filter: {topic_filter!r}"
+        levels = topic_filter.split("/")
+        for n, level in enumerate(levels):
+            assert level == "#" and n == len(levels) - 1 or "#" not in level, f"bad topic filter: {topic_filter!r}"
+            assert level == "+" or "+" not in level, f"bad topic filter: {topic_filter!r}"
+        node = self.root
+        for level in levels:
+            if level == "#":
+                node.rest.append((self.count, value))
+                break
+            node = node.children.setdefault(level, TopicTrie.Node())
+        else:
+            node.values.append((self.count, value))
+        self.count += 1
+        self.memo.clear()
+
+    def match(self, topic):
+        """Returns a tuple of values for filters matching topic."""
+        try:
+            return self.memo[topic]
+        except KeyError:
+            pass
+        found = list()
+        levels = topic.split("/")
+        # wildcards at the first level do not match topics starting with $ (e.g. $SYS/...)
+        self._match(self.root, levels, 0, found, not topic.startswith("$"))
+        found.sort(key=lambda x: x[0])
+        # a value added under overlapping filters is only returned once
+        values = tuple(dict.fromkeys(x[1] for x in found))
+        if len(self.memo) >= self.MaxMemo:
+            self.memo.clear()
+        self.memo[topic] = values
+        return values
+
+    def _match(self, node, levels, idx, found, wild):
+        # "a/#" matches "a" as well as everything below it
+        if wild:
+            found.extend(node.rest)
+        if idx == len(levels):
+            found.extend(node.values)
+            return
+        child = node.children.get(levels[idx])
+        if child is not None:
+            self._match(child, levels, idx + 1, found, True)
+        if wild:
+            child = node.children.get("+")
+            if child is not None:
+                self._match(child, levels, idx + 1, found, True)
+
+
+
+def topic_filter_covers(general, specific):
+    """Returns True if every topic matched by the filter specific is also matched by general."""
+    g = general.split("/")
+    s = specific.split("/")
+    for n, level in enumerate(g):
+        if level == "#":
+            # wildcards at the first level don't match $ topics
+            return n > 0 or not s[0].startswith("$")
+        if n >= len(s) or s[n] == "#":
+            return False
+        if level == "+":
+            if n == 0 and s[0].startswith("$"):
+                return False
+            continue
+        if level != s[n]:
+            return False
+    return len(g) == len(s)
+
+
+def minimal_topic_filters(filters):
+    """Returns a sorted list of filters with any filter covered by another one removed."""
+    filters = sorted(set(filters))
+    return [
+        f
+        for f in filters
+        if not any(o != f and topic_filter_covers(o, f) for o in filters)
+    ]
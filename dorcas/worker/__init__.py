@@ -4,9 +4,12 @@ import sys
 import os
 import threading
 import time
-import pigpio
 from abc import ABC, abstractmethod
 
+# Project modules
+from dorcas.worker.motion import MotionScheduler, Track
+from dorcas.worker.pins import pins
+
 
 log = logging.getLogger(__name__)
 
@@ -44,32 +47,11 @@ class Worker(ABC):
             return True
 
 
-def frange(start, end, steps):
-    assert type(steps) is int
-    assert steps > 0
-    increment = (end - start) / steps
-    while True:
-        if increment > 0:
-            if start >= end:
-                break
-        else:
-            if start <= end:
-                break
-        yield start
-        start += increment
-    if start != end:
-        yield end
-
-
-try:
-    PigPi = pigpio.pi()
-    assert PigPi.connected is True
-except:
-    log.warning("pigpio not connected - PWM functions disabled")
-    PigPi = None
+class PwmFader(ABC):
+    """A PWM output which can be moved smoothly between values.
 
+    Moves are Tracks played by the MotionScheduler, so they don't need a thread each."""
 
-class PwmFader(ABC):
     def __init__(self, pin, min_value, max_value, default_duration, default_steps_per_second, only_active_while_fading):
         log.debug("PwmFader.__init__")
         self.pin = pin
@@ -78,9 +60,7 @@ class PwmFader(ABC):
         self.default_duration = default_duration
         self.default_steps_per_second = default_steps_per_second
         self.only_active_while_fading = only_active_while_fading
-        self.thread = None
         self.value = None
-        self.fading = False
 
     def __del__(self, *args):
         log.debug("PwmFader.del")
@@ -89,52 +69,54 @@ class PwmFader(ABC):
         except:
             pass
 
+    @property
+    def fading(self):
+        return MotionScheduler().moving(self)
+
     def activate(self):
         log.debug(f"PwmFader.activate pin={self.pin}")
-        if PigPi and PigPi.get_mode(self.pin) != pigpio.OUTPUT:
-            PigPi.set_mode(self.pin, pigpio.OUTPUT)
+        pins().set_output(self.pin, True)
 
     def deactivate(self):
         log.debug(f"PwmFader.deactivate pin={self.pin}")
-        if PigPi and PigPi.get_mode(self.pin) != pigpio.INPUT:
-            PigPi.set_mode(self.pin, pigpio.INPUT)
+        pins().set_output(self.pin, False)
 
     def cancel_fade(self):
         log.debug("PwmFader.cancel_fade")
-        if self.thread:
-            self.fading = False
-            self.thread.join()
-            self.thread = None
+        MotionScheduler().cancel(self)
 
     @abstractmethod
     def set(self, value):
         pass
 
-    def fade_to(self, value, duration=None, steps_per_second=None):
+    def fade_to(self, value, duration=None, steps_per_second=None, easing="linear"):
+        """Start moving to value (non-blocking). Returns a Track, which can be waited for."""
         log.debug(f"PwmFader.fade(value={value}, duration={duration} steps_per_second={steps_per_second})")
         if duration is None:
             duration = self.default_duration
+        return self.animate([(duration, value, easing)], steps_per_second)
+
+    def animate(self, keyframes, steps_per_second=None):
+        """Start moving through keyframes (non-blocking). Returns a Track, which can be waited for.
+
+        keyframes - list of (seconds from now, value) or (seconds from now, value, easing), where
+                    easing is one of motion.Easings (default "linear")
+        """
         if steps_per_second is None:
             steps_per_second = self.default_steps_per_second
-        self.cancel_fade()
-        self.thread = threading.Thread(target=self._fade, args=(self.value, value, duration, steps_per_second))
-        self.thread.start()
-
-    def _fade(self, start, end, duration, steps_per_second):
-        if start is None:
-            self.set(end)
-            return
-        steps = int(duration * self.default_steps_per_second)
-        step_duration = duration / steps
+        keyframes = [(x[0], x[1], x[2] if len(x) > 2 else "linear") for x in keyframes]
+        track = Track(self, self.value, keyframes, 1.0 / steps_per_second)
+        if self.value is None:
+            # nowhere to fade from
+            self.cancel_fade()
+            self.set(track.final_value)
+            track.done.set()
+            return track
         self.activate()
-        self.fading = True
-        for v in frange(start, end, steps):
-            if not self.fading:
-                return
-            self.set(int(v))
-            time.sleep(step_duration)
-        self.set(end)
-        self.fading = False
+        return MotionScheduler().play(track)
+
+    def track_done(self, track):
+        """Called by the MotionScheduler when a track has finished (not when it's cancelled)"""
         if self.only_active_while_fading:
             self.deactivate()
 
@@ -146,8 +128,7 @@ class ServoFader(PwmFader):
 
     def set(self, value):
         assert value >= self.min and value <= self.max, f"value={value} min={self.min} max={self.max}"
-        if PigPi:
-            PigPi.set_servo_pulsewidth(self.pin, value)
+        pins().set_servo(self.pin, value)
         self.value = value
 
 class LedFader(PwmFader):
@@ -160,7 +141,5 @@ class LedFader(PwmFader):
 
     def set(self, value):
         assert value >= self.Min and value <= self.Max
-        if PigPi:
-            PigPi.set_PWM_dutycycle(self.pin, value)
+        pins().set_pwm(self.pin, value)
         self.value = value
-
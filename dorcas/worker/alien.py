@@ -49,16 +49,14 @@ class Alien(ServoFader):
         if self.brain.get("silence"):
             log.debug("SILENCED")
             return
-        self.fade_to(self.ShowPos, duration)
+        track = self.fade_to(self.ShowPos, duration)
         if not bg:
-            self.thread.join()
-            self.thread = None
+            track.wait()
 
     def hide(self, duration=None, bg=False):
         if self.brain.get("silence"):
             log.debug("SILENCED")
             return
-        self.fade_to(self.HidePos, duration)
+        track = self.fade_to(self.HidePos, duration)
         if not bg:
-            self.thread.join()
-            self.thread = None
+            track.wait()
@@ -4,17 +4,18 @@ import sys
 import threading
 import subprocess as sp
 import logging
+import json
 import time
-import glob
-import cachetools.func
-import pathlib
 
 # PIP-installed modules
 from singleton_decorator import singleton
+import arrow
 
 # Project modules
 from dorcas import database
 from dorcas.worker import Worker
+from dorcas.worker.audiocatalogue import AudioCatalogue
+from dorcas.worker.mixer import Clip, Mixer
 from dorcas.worker.mqttclient import MqttClient
 
 log = logging.getLogger(__name__)
@@ -22,35 +23,88 @@ log = logging.getLogger(__name__)
 
 @singleton
 class Audio(Worker):
+    """Plays audio files by id.
+
+    Short sounds are played by the in-process Mixer if it's available, longer ones (and everything
+    if it isn't) by a play process for each.
+
+    audio/begin and audio/end are published with the id. When a sound finishes (without being
+    interrupted), audio/timing is published too: JSON with id, begin, end and duration."""
+
     BackgroundPlayerLimit = 10
+    # Longest sound (seconds) to decode into memory for the mixer
+    MaxMixSeconds = 30.0
 
     def __init__(self, brain, kill_on_halt=True):
         log.info(f"Worker {self.__class__.__name__}.__init__")
         super().__init__(brain)
         self.kill_on_halt = kill_on_halt
-        self.players = list()
+        self.cond = threading.Condition(threading.RLock())
+        self.stopping = threading.Event()
+        self.players = list()  # (id, Popen or Clip), in the order they started
+        self.catalogue = AudioCatalogue(self.search_paths())
+        # configure the singleton
+        Mixer(brain.timers)
 
     def run(self):
         log.info(f"{self.__class__.__name__}.run BEGIN")
-        while not self.halt:
-            time.sleep(0.25)
-            self.reap_players()
+        self.catalogue.start()
+        # players are reaped by their own waiter threads (or the mixer), so there's nothing to do
+        self.stopping.wait()
         if self.kill_on_halt:
             self.kill_players()
         else:
             self.wait_for_players()
+        self.catalogue.stop()
         log.info(f"{self.__class__.__name__}.run END")
 
-    def reap_players(self):
-        """reap any completed player processes"""
-        keep = list()
-        for path, p in self.players:
-            if p and p.poll() is not None:
-                log.debug(f"Audio.reap_players reaped path={path} status={p.wait()}")
-                MqttClient().publish(self.brain.topic("audio/end"), path)
-            else:
-                keep.append((path, p))
-        self.players = keep
+    def stop(self):
+        super().stop()
+        self.stopping.set()
+
+    def start_player(self, id, cmd):
+        """Start a player process, and a thread which waits for it to finish"""
+        with self.cond:
+            begin = time.monotonic()
+            begin_wall = time.time()
+            p = sp.Popen(cmd)
+            self.players.append((id, p))
+        threading.Thread(target=self.await_player, args=(id, p, begin, begin_wall), daemon=True).start()
+
+    def await_player(self, id, p, begin, begin_wall):
+        status = p.wait()
+        log.debug(f"Audio.await_player reaped path={id} status={status}")
+        self.player_ended(id, p, begin, time.monotonic(), begin_wall)
+
+    def clip_ended(self, clip):
+        self.player_ended(clip.id, clip, clip.started, clip.ended, clip.started_wall, clip.interrupted)
+
+    def player_ended(self, id, player, begin, end, begin_wall, interrupted=False):
+        """Called when a player process or mixer clip finishes. Publishes audio/end unless it was
+        interrupted (which includes being taken out of self.players by interrupt_sound)."""
+        with self.cond:
+            if not any([x[1] is player for x in self.players]):
+                interrupted = True
+            self.players = [x for x in self.players if x[1] is not player]
+            self.cond.notify_all()
+        if interrupted:
+            return
+        MqttClient().publish(self.brain.topic("audio/end"), id)
+        self.record(id, begin, end, begin_wall)
+
+    def record(self, id, begin, end, begin_wall):
+        """Note the timing of a sound which has finished playing, in the brain state, and publish it
+        on audio/timing. begin and end are monotonic times, begin_wall is time.time() when it began
+        (the end is worked out from that and the monotonic duration)."""
+        if begin is None:
+            begin, begin_wall = end, time.time()
+        duration = end - begin
+        log.debug(f"Audio: {id!r} played for {duration:.3f}s")
+        begin_time = arrow.get(begin_wall).to("local")
+        end_time = begin_time.shift(seconds=duration)
+        self.brain.set("last_audio", {"id": id, "begin": begin_time, "end": end_time, "duration": duration})
+        timing = {"id": id, "begin": begin_time.isoformat(), "end": end_time.isoformat(), "duration": round(duration, 3)}
+        MqttClient().publish(self.brain.topic("audio/timing"), json.dumps(timing))
 
     def interrupt_sound(self, stop_path, instance=0):
         """Stop a specific sound from playing. If instance == 0, stop all instances, else stop specific instance #."""
@@ -58,31 +112,41 @@ class Audio(Worker):
             f"Audio.interrupt_sound(stop_path={stop_path!r}, instance={instance!r}"
         )
         keep = list()
+        clips = list()
         count = 0
-        for path, p in self.players:
-            kill_it = False
-            if stop_path == path:
-                count += 1
-                if instance in (0, count) and p and p.poll() is not None:
-                    kill_it = True
-            if kill_it:
-                p.kill()
-                log.debug(f"Audio.interrupt_sound killed; status={p.wait()}")
-            else:
-                keep.append((path, p))
-        self.players = keep
+        with self.cond:
+            for path, p in self.players:
+                kill_it = False
+                if stop_path == path:
+                    count += 1
+                    if instance in (0, count) and p and (isinstance(p, Clip) or p.poll() is None):
+                        kill_it = True
+                if kill_it and isinstance(p, Clip):
+                    clips.append(p)
+                elif kill_it:
+                    p.kill()
+                    log.debug(f"Audio.interrupt_sound killed; status={p.wait()}")
+                else:
+                    keep.append((path, p))
+            self.players = keep
+            self.cond.notify_all()
+        # takes effect with the next mixed block
+        Mixer().interrupt(clips)
 
     def kill_players(self):
         log.debug(f"Audio.kill_players")
-        for _, p in self.players:
-            p.kill()
-        self.reap_players()
+        with self.cond:
+            for _, p in self.players:
+                if not isinstance(p, Clip):
+                    p.kill()
+        Mixer().stop()
+        self.wait_for_players()
 
     def wait_for_players(self):
         log.debug(f"Audio.wait_for_players")
-        while len(self.players) > 0:
-            time.sleep(0.25)
-            self.reap_players()
+        Mixer().stop(wait=True)
+        with self.cond:
+            self.cond.wait_for(lambda: len(self.players) == 0)
 
     def play(self, id, bg=True, volume=1.0):
         """Play an audio file by id
@@ -103,30 +167,62 @@ class Audio(Worker):
             return
         path = self.get_path(id)
         log.debug(f"play path={path!r}")
+        if bg and len(self.players) >= self.BackgroundPlayerLimit:
+            return False
+        if self.mixable(id):
+            try:
+                clip = self.play_clip(id, path, volume)
+            except Exception as e:
+                log.debug(f"Audio.play exception={e}")
+                return False
+            if not bg:
+                clip.done.wait()
+                return not clip.interrupted
+            return True
         cmd = ["play", "-q", path, "vol", str(volume)]
         if not bg:
             self.brain.be_polite()
             MqttClient().publish(self.brain.topic("audio/begin"), id)
+            begin = time.monotonic()
+            begin_wall = time.time()
             code = sp.run(cmd).returncode
             MqttClient().publish(self.brain.topic("audio/end"), id)
+            self.record(id, begin, time.monotonic(), begin_wall)
             return code == 0
-        if len(self.players) >= self.BackgroundPlayerLimit:
-            return False
         try:
             self.brain.be_polite()
             MqttClient().publish(self.brain.topic("audio/begin"), id)
-            self.players.append((id, sp.Popen(cmd)))
+            self.start_player(id, cmd)
         except Exception as e:
             log.debug(f"Audio.play exception={e}")
             return False
         return True
 
+    def mixable(self, id):
+        """True if the sound is short enough to be played by the mixer"""
+        if not Mixer().available:
+            return False
+        info = self.info(id)
+        return info is not None and info.duration <= self.MaxMixSeconds
+
+    def play_clip(self, id, path, volume):
+        self.brain.be_polite()
+        MqttClient().publish(self.brain.topic("audio/begin"), id)
+        with self.cond:
+            clip = Mixer().play(id, path, volume, on_end=self.clip_ended)
+            self.players.append((id, clip))
+        return clip
+
     def get_path(self, id):
         """Get the full path of an audio file from the id
 
         Arguments:
         id - the file name without the preceding audio dir e.g. "creepy/toll.wav"
         """
+        path = self.catalogue.get_path(id)
+        if path is not None:
+            return path
+        # it may have been added since the catalogue was last updated
         for d in self.search_paths():
             path = os.path.join(d, id)
             if os.path.exists(path):
@@ -139,55 +235,18 @@ class Audio(Worker):
         searchstr - value to be searched for in file basenames.
         subdir - sub-directory to search in within each path in DORCAS_AUDIO_DIRS.
         """
-        # don't want to use a set because we'll lose order, so we'll list and test
-        # before adding.
-        ids = list()
-
-        def already_have(basename):
-            return sum([1 for x in ids if os.path.basename(x) == basename]) > 0
-
-        def add_id(id):
-            if not already_have(id):
-                ids.append(id)
-
-        for d in [os.path.join(x, subdir) for x in self.search_paths()]:
-            plp = pathlib.Path(d)
-            for fullpath in [
-                str(p) for p in filter(lambda x: x.is_file(), plp.glob("*"))
-            ]:
-                idx = len(d) - len(subdir)
-                id = fullpath[idx:]
-                bn = os.path.basename(id)
-                if searchstr in bn:
-                    add_id(id)
-        return ids
+        return self.catalogue.find(searchstr, subdir)
 
     def all(self):
-        ids = set()
-        for d in self.subdirs():
-            for id in self.find(subdir=d):
-                ids.add(os.path.join(d, id))
-        return sorted(list(ids))
+        return self.catalogue.all()
 
     def subdirs(self, searchstr=""):
         """Get a listof audio file sub-directories (without the DORCAS_AUDIO_DIR prefixes)"""
+        return self.catalogue.subdirs(searchstr)
 
-        def str_eq(s1, s2):
-            if case_sensitive:
-                return s1 == s2
-            else:
-                return s1.lower() == s2.lower()
-
-        dirs = set([""])
-        for d in self.search_paths():
-            plp = pathlib.Path(d)
-            start_idx = len(d) + 1
-            for pp in [
-                str(p)[start_idx:] for p in filter(lambda x: x.is_dir(), plp.rglob("*"))
-            ]:
-                if searchstr in pp:
-                    dirs.add(str(pp))
-        return dirs
+    def info(self, id):
+        """Get an AudioInfo (format, rate, channels, width, duration) for an audio file, or None"""
+        return self.catalogue.info(id)
 
     def search_paths(self):
         """Get list of dirs to search for audio files from DORCAS_AUDIO_DIRS and sample audio dir."""
@@ -0,0 +1,243 @@
+# Python built-in modules
+import os
+import sys
+import threading
+import subprocess as sp
+import logging
+import ctypes
+import ctypes.util
+import re
+import select
+import wave
+from collections import namedtuple
+
+
+log = logging.getLogger(__name__)
+
+
+AudioInfo = namedtuple("AudioInfo", ["format", "rate", "channels", "width", "duration"])
+
+
+def read_info(path):
+    """Returns an AudioInfo for the file at path, or None if it can't be read"""
+    if path.lower().endswith(".wav"):
+        try:
+            with wave.open(path, "rb") as w:
+                rate = w.getframerate()
+                return AudioInfo("wav", rate, w.getnchannels(), w.getsampwidth(), w.getnframes() / rate)
+        except (wave.Error, EOFError, OSError):
+            # e.g. not PCM, let sox have a go
+            pass
+    try:
+        out = sp.run(["soxi", path], capture_output=True, text=True, timeout=10).stdout
+    except (OSError, sp.TimeoutExpired) as e:
+        log.debug(f"read_info {path!r}: {e}")
+        return None
+    fields = dict([[y.strip() for y in x.split(":", 1)] for x in out.splitlines() if ":" in x])
+    try:
+        rate = int(fields["Sample Rate"])
+        samples = int(re.search(r"=\s*(\d+)\s+samples", fields["Duration"]).group(1))
+        return AudioInfo(
+            fields.get("File Type", os.path.splitext(path)[1][1:]),
+            rate,
+            int(fields["Channels"]),
+            int(fields.get("Precision", "16-bit").split("-")[0]) // 8,
+            samples / rate,
+        )
+    except (KeyError, ValueError, AttributeError):
+        log.debug(f"read_info {path!r}: can't understand soxi output")
+        return None
+
+
+class Inotify:
+    """Minimal inotify(7) binding, used only to find out that something has changed"""
+
+    NonBlock = 0o4000
+    CloseOnExec = 0o2000000
+    # IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    Mask = 0x8 | 0x40 | 0x80 | 0x100 | 0x200 | 0x400 | 0x800
+
+    def __init__(self):
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(self.NonBlock | self.CloseOnExec)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def watch(self, path):
+        if self.libc.inotify_add_watch(self.fd, os.fsencode(path), self.Mask) < 0:
+            log.debug(f"Inotify.watch {path!r}: {os.strerror(ctypes.get_errno())}")
+
+    def fileno(self):
+        return self.fd
+
+    def drain(self):
+        """Read and discard pending events. Returns True if there were any."""
+        got = False
+        while True:
+            try:
+                got = len(os.read(self.fd, 65536)) > 0 or got
+            except BlockingIOError:
+                return got
+
+    def close(self):
+        os.close(self.fd)
+
+
+class AudioCatalogue:
+    """An in-memory index of the audio files in a list of directories, kept up to date as they change"""
+
+    Index = namedtuple("Index", ["files", "by_dir", "by_name", "dirs"])
+    Entry = namedtuple("Entry", ["path", "size", "mtime"])
+
+    PollInterval = 5.0
+    # Even with inotify, rebuild this often in case something was missed (e.g. an audio dir which
+    # didn't exist when it was watched)
+    RebuildInterval = 300.0
+    # Seconds to wait for things to settle after a change (e.g. copying lots of files)
+    Settle = 0.5
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        self.lock = threading.Lock()
+        self.info_cache = dict()  # Entry: AudioInfo
+        self.inotify = None
+        self.thread = None
+        self.halt = False
+        self.wake = threading.Event()
+        self.dir_mtimes = dict()
+        self.index = self.build()
+
+    def build(self):
+        files = dict()
+        by_dir = dict()
+        dirs = set([""])
+        dir_mtimes = dict()
+        for base in self.paths:
+            for dirpath, dirnames, filenames in os.walk(base):
+                dirnames.sort()
+                try:
+                    dir_mtimes[dirpath] = os.stat(dirpath).st_mtime_ns
+                except OSError:
+                    continue
+                subdir = os.path.relpath(dirpath, base)
+                subdir = "" if subdir == "." else subdir
+                dirs.add(subdir)
+                for name in sorted(filenames):
+                    id = os.path.join(subdir, name)
+                    if id in files:
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    files[id] = self.Entry(path, st.st_size, st.st_mtime_ns)
+                    by_dir.setdefault(subdir, list()).append(id)
+        by_name = dict()
+        for id in files:
+            by_name.setdefault(os.path.basename(id), list()).append(id)
+        self.dir_mtimes = dir_mtimes
+        with self.lock:
+            # drop metadata for files which have gone or changed
+            live = set(files.values())
+            self.info_cache = {k: v for k, v in self.info_cache.items() if k in live}
+        return self.Index(
+            files,
+            {k: tuple(v) for k, v in by_dir.items()},
+            {k: tuple(v) for k, v in by_name.items()},
+            frozenset(dirs),
+        )
+
+    def rebuild(self):
+        self.index = self.build()
+        if self.inotify is not None:
+            for d in self.dir_mtimes.keys():
+                self.inotify.watch(d)
+        log.info(f"AudioCatalogue: {len(self.index.files)} files in {len(self.index.dirs)} directories")
+
+    def start(self):
+        try:
+            self.inotify = Inotify()
+        except (OSError, AttributeError) as e:
+            log.warning(f"AudioCatalogue: no inotify ({e}), polling for changes instead")
+            self.inotify = None
+        self.halt = False
+        self.wake.clear()
+        self.rebuild()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.halt = True
+        self.wake.set()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None
+
+    def run(self):
+        waited = 0.0
+        while not self.halt:
+            if self.inotify is None:
+                self.wake.wait(self.PollInterval)
+                if not self.halt and self.dirs_changed():
+                    self.rebuild()
+                continue
+            # wake at least once a second so stop() doesn't have to wait long
+            ready, _, _ = select.select([self.inotify], [], [], 1.0)
+            waited += 1.0
+            if ready and self.inotify.drain():
+                self.wake.wait(self.Settle)
+                self.inotify.drain()
+            elif waited < self.RebuildInterval:
+                continue
+            waited = 0.0
+            if not self.halt:
+                self.rebuild()
+
+    def dirs_changed(self):
+        for base in self.paths:
+            if os.path.isdir(base) and base not in self.dir_mtimes:
+                return True
+        for d, mtime in self.dir_mtimes.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def get_path(self, id):
+        """Returns the full path for id, or None"""
+        entry = self.index.files.get(os.path.normpath(id))
+        return None if entry is None else entry.path
+
+    def find(self, searchstr="", subdir=""):
+        """Returns ids of files directly in subdir which have searchstr in their basename"""
+        subdir = os.path.normpath(subdir) if subdir else ""
+        return [x for x in self.index.by_dir.get(subdir, ()) if searchstr in os.path.basename(x)]
+
+    def named(self, basename):
+        """Returns ids of files with this basename, in any directory"""
+        return list(self.index.by_name.get(basename, ()))
+
+    def subdirs(self, searchstr=""):
+        return set([x for x in self.index.dirs if searchstr in x])
+
+    def all(self):
+        return sorted(self.index.files.keys())
+
+    def info(self, id):
+        """Returns an AudioInfo for id, or None if it's not known or can't be read"""
+        entry = self.index.files.get(os.path.normpath(id))
+        if entry is None:
+            return None
+        with self.lock:
+            if entry in self.info_cache:
+                return self.info_cache[entry]
+        info = read_info(entry.path)
+        with self.lock:
+            self.info_cache[entry] = info
+        return info
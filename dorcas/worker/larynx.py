@@ -0,0 +1,284 @@
+# Python built-in modules
+import os
+import sys
+import threading
+import subprocess as sp
+import logging
+import select
+import struct
+import time
+import wave
+
+# PIP-installed modules
+from singleton_decorator import singleton
+
+
+log = logging.getLogger(__name__)
+
+
+def make_engine_cmd(voice):
+    """Get a command for a long-lived speech engine for voice.
+
+    With no text argument espeak reads text from stdin a line at a time, and with --stdout writes a
+    single WAV stream, flushed after each line."""
+    cmd = [voice.engine]
+    cmd.extend(["-v", voice.voice])
+    cmd.extend(["-s", str(voice.speed)])
+    cmd.extend(["-p", str(voice.pitch)])
+    cmd.extend(["-a", str(voice.amplitude)])
+    cmd.append("--stdout")
+    return cmd
+
+
+def raw_format(rate, channels, width):
+    """sox format options for raw signed PCM"""
+    return ["-t", "raw", "-r", str(rate), "-e", "signed-integer", "-b", str(width * 8), "-c", str(channels)]
+
+
+class SpeechEngine:
+    """A long-lived speech engine process for one voice, so voice data is only loaded once.
+
+    espeak gives no sign of when it has finished with a line. Audio for a line is taken to be
+    complete when the output has been quiet for QuietTime seconds *and* the process is asleep
+    (waiting for more input) - a process which has only been held up by the scheduler is still
+    runnable, so a stall on a busy machine doesn't cut speech short. Any output left over from an
+    earlier line is drained before each new one, so it can't end up in front of the wrong speech.
+    The process is re-spawned if it dies."""
+
+    QuietTime = 0.2
+    StartTimeout = 10.0
+    MaxTime = 60.0
+    HeaderSize = 44
+
+    def __init__(self, voice):
+        self.cmd = make_engine_cmd(voice)
+        self.lock = threading.Lock()
+        self.proc = None
+        self.format = None  # (rate, channels, width) from the WAV header
+
+    def spawn(self):
+        self.close()
+        log.debug(f"SpeechEngine.spawn {self.cmd}")
+        self.proc = sp.Popen(self.cmd, stdin=sp.PIPE, stdout=sp.PIPE, stderr=sp.DEVNULL, bufsize=0)
+        self.format = None
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def idle(self):
+        """True if the engine process is asleep (i.e. waiting for input). Without /proc, assume so."""
+        try:
+            with open(f"/proc/{self.proc.pid}/stat") as f:
+                stat = f.read()
+        except OSError:
+            return True
+        # the state follows the command name, which is in parentheses (and may contain spaces)
+        return stat[stat.rindex(")") + 2] == "S"
+
+    def read(self, timeout):
+        """Returns bytes available within timeout seconds (empty if none). Raises RuntimeError if
+        the engine has closed its output."""
+        fd = self.proc.stdout.fileno()
+        ready, _, _ = select.select([fd], [], [], timeout)
+        if not ready:
+            return b""
+        data = os.read(fd, 65536)
+        if len(data) == 0:
+            raise RuntimeError("speech engine closed its output")
+        return data
+
+    def collect(self, pcm, first_timeout):
+        """Read into pcm until the engine is quiet and idle"""
+        started = time.monotonic()
+        timeout = first_timeout
+        while time.monotonic() - started < self.MaxTime:
+            data = self.read(timeout)
+            if len(data) > 0:
+                pcm.extend(data)
+                timeout = self.QuietTime
+            elif self.idle():
+                return
+            elif len(pcm) == 0 and time.monotonic() - started >= first_timeout:
+                raise RuntimeError("no output from speech engine")
+            else:
+                timeout = self.QuietTime
+        log.warning(f"SpeechEngine: still going after {self.MaxTime}s, taking what there is")
+
+    def drain(self):
+        """Discard anything left from earlier lines, so output lines up with the next request"""
+        stale = bytearray()
+        while True:
+            data = self.read(0)
+            if len(data) == 0:
+                if len(stale) == 0 or self.idle():
+                    break
+                data = self.read(self.QuietTime)
+            stale.extend(data)
+        if len(stale) > 0:
+            log.warning(f"SpeechEngine: discarded {len(stale)} bytes of stale output")
+            if self.format is None and len(stale) >= self.HeaderSize:
+                self.parse_header(stale)
+
+    def parse_header(self, pcm):
+        channels, rate = struct.unpack_from("<HI", pcm, 22)
+        bits = struct.unpack_from("<H", pcm, 34)[0]
+        self.format = (rate, channels, bits // 8)
+        del pcm[: self.HeaderSize]
+
+    def synthesize(self, text):
+        """Returns (rate, channels, width, pcm_bytes). Raises RuntimeError on failure."""
+        with self.lock:
+            for attempt in range(2):
+                try:
+                    if self.proc is None or self.proc.poll() is not None:
+                        if self.proc is not None:
+                            log.warning(f"speech engine died with status {self.proc.returncode}; re-spawning")
+                        self.spawn()
+                    return self._synthesize(text)
+                except (OSError, RuntimeError) as e:
+                    log.warning(f"SpeechEngine.synthesize: {e}")
+                    self.close()
+            raise RuntimeError(f"speech engine failed for {text!r}")
+
+    def _synthesize(self, text):
+        self.drain()
+        line = " ".join(text.splitlines()).strip() + "\n"
+        self.proc.stdin.write(line.encode())
+        pcm = bytearray()
+        self.collect(pcm, self.StartTimeout)
+        if self.format is None:
+            if len(pcm) < self.HeaderSize:
+                raise RuntimeError("no WAV header from speech engine")
+            self.parse_header(pcm)
+        return self.format + (bytes(pcm),)
+
+
+class AudioSink:
+    """A long-lived play process for raw PCM, so the audio device is only opened once.
+
+    Audio is written (by paced_write) no more than lead seconds ahead of real time, so it can be
+    stopped quickly.
+    The process is re-spawned if it dies, or after stopping part-way through (to drop whatever is
+    buffered)."""
+
+    Lead = 0.2
+    BlockSeconds = 0.05
+
+    def __init__(self, rate, channels, width, lead=Lead):
+        self.format = (rate, channels, width)
+        self.lead = lead
+        self.bytes_per_second = rate * channels * width
+        self.cmd = ["play", "-q"] + raw_format(rate, channels, width) + ["-"]
+        self.lock = threading.Lock()
+        self.proc = None
+        self.busy_until = 0.0
+
+    def spawn(self):
+        self.close()
+        log.debug(f"AudioSink.spawn {self.cmd}")
+        self.proc = sp.Popen(self.cmd, stdin=sp.PIPE, bufsize=0)
+        self.busy_until = 0.0
+
+    def close(self):
+        if self.proc is not None:
+            try:
+                self.proc.stdin.close()
+            except OSError:
+                pass
+            self.proc.kill()
+            self.proc.wait()
+            self.proc = None
+
+    def play(self, pcm, stop=None):
+        """Play pcm (blocking until it should have finished). stop is a function which returns True
+        if playing should stop early. Returns False if stopped or failed."""
+        rate, channels, width = self.format
+        frame_size = channels * width
+        block = max(frame_size, int(rate * self.BlockSeconds) * frame_size)
+        with self.lock:
+            for offset in range(0, len(pcm), block):
+                if stop is not None and stop():
+                    self.spawn()
+                    return False
+                if not self.paced_write(pcm[offset : offset + block]):
+                    return False
+            while self.remaining() > 0:
+                if stop is not None and stop():
+                    self.spawn()
+                    return False
+                time.sleep(min(self.BlockSeconds, self.remaining()))
+            return True
+
+    def paced_write(self, chunk):
+        """Write chunk, first waiting until it would be no more than lead seconds ahead of real time.
+        Returns False if the write failed."""
+        now = time.monotonic()
+        if self.busy_until < now:
+            # starting from silence
+            self.busy_until = now
+        elif self.busy_until - now > self.lead:
+            time.sleep(self.busy_until - now - self.lead)
+        if not self.write(chunk):
+            return False
+        self.busy_until = max(self.busy_until, time.monotonic()) + len(chunk) / self.bytes_per_second
+        return True
+
+    def remaining(self):
+        """Seconds until everything written so far should have been heard"""
+        return max(0.0, self.busy_until - time.monotonic())
+
+    def write(self, chunk):
+        for attempt in range(2):
+            try:
+                if self.proc is None or self.proc.poll() is not None:
+                    if self.proc is not None:
+                        log.warning(f"audio sink died with status {self.proc.returncode}; re-spawning")
+                    self.spawn()
+                self.proc.stdin.write(chunk)
+                return True
+            except OSError as e:
+                log.warning(f"AudioSink.write: {e}")
+                self.close()
+        return False
+
+
+@singleton
+class Larynx:
+    """Keeps the long-lived speech engine (one per voice) and audio sink (one per audio format)
+    processes."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.engines = dict()
+        self.sinks = dict()
+
+    def engine(self, voice):
+        key = tuple(make_engine_cmd(voice))
+        with self.lock:
+            if key not in self.engines:
+                self.engines[key] = SpeechEngine(voice)
+            return self.engines[key]
+
+    def sink(self, rate, channels, width):
+        key = (rate, channels, width)
+        with self.lock:
+            if key not in self.sinks:
+                self.sinks[key] = AudioSink(rate, channels, width)
+            return self.sinks[key]
+
+    def play_file(self, path, stop=None):
+        """Play a WAV file through the sink for its format. Returns False if stopped or failed."""
+        with wave.open(path, "rb") as w:
+            params = (w.getframerate(), w.getnchannels(), w.getsampwidth())
+            pcm = w.readframes(w.getnframes())
+        return self.sink(*params).play(pcm, stop)
+
+    def close(self):
+        with self.lock:
+            for x in list(self.engines.values()) + list(self.sinks.values()):
+                x.close()
+            self.engines = dict()
+            self.sinks = dict()
@@ -0,0 +1,186 @@
+# Python built-in modules
+import os
+import sys
+import threading
+import subprocess as sp
+import logging
+import time
+import warnings
+
+# audioop is deprecated (and gone from the standard library in python 3.13, but the audioop-lts
+# package provides it). Without it, Audio spawns a player for each sound.
+try:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        import audioop
+except ImportError:
+    audioop = None
+
+# PIP-installed modules
+from singleton_decorator import singleton
+import cachetools
+
+# Project modules
+from dorcas.worker.larynx import AudioSink, raw_format
+
+
+log = logging.getLogger(__name__)
+
+
+class Clip:
+    """A sound being played by the Mixer"""
+
+    def __init__(self, id, pcm, volume, on_end):
+        self.id = id
+        self.pcm = pcm
+        self.volume = volume
+        self.on_end = on_end
+        self.pos = 0
+        self.interrupted = False
+        self.started = None
+        self.started_wall = None  # time.time() at the same moment as started
+        self.ended = None
+        self.done = threading.Event()
+
+    def finish(self, interrupted):
+        self.interrupted = interrupted
+        self.ended = time.monotonic()
+        self.done.set()
+        if self.on_end is not None:
+            try:
+                self.on_end(self)
+            except Exception as e:
+                log.exception(f"Clip.on_end for {self.id!r}")
+
+
+@singleton
+class Mixer:
+    """Plays any number of short sounds at once through one long-lived audio sink.
+
+    Sounds are decoded to raw PCM by sox the first time they're played, and kept in a memory cache
+    bounded at MaxCacheBytes. The mixing thread mixes the playing sounds a block at a time, each with
+    its own volume, and writes no more than Lead seconds ahead of real time. That means a stopped
+    sound goes quiet almost at once.
+
+    The first Mixer() call must pass the brain's timers, which are used to call back when the end of
+    a clip should have been heard."""
+
+    Rate = 44100
+    Channels = 2
+    Width = 2
+    BlockSeconds = 0.02
+    Lead = 0.1
+    MaxCacheBytes = 32 * 1024 * 1024
+
+    def __init__(self, timers):
+        log.info(f"{self.__class__.__name__}.__init__")
+        self.timers = timers
+        self.available = audioop is not None
+        self.cond = threading.Condition()
+        self.decode_lock = threading.Lock()
+        self.cache = cachetools.LRUCache(maxsize=self.MaxCacheBytes, getsizeof=len)
+        self.clips = list()
+        self.sink = None
+        self.thread = None
+        self.halt = False
+        self.frame_size = self.Channels * self.Width
+        self.block_size = int(self.Rate * self.BlockSeconds) * self.frame_size
+
+    def decode(self, path):
+        """Returns the raw PCM for path, from the cache if possible. Raises RuntimeError on failure."""
+        with self.decode_lock:
+            mtime = os.stat(path).st_mtime_ns
+            key = (path, mtime)
+            pcm = self.cache.get(key)
+            if pcm is None:
+                cmd = ["sox", path] + raw_format(self.Rate, self.Channels, self.Width) + ["-"]
+                proc = sp.run(cmd, stdout=sp.PIPE, stderr=sp.DEVNULL)
+                if proc.returncode != 0:
+                    raise RuntimeError(f"could not decode {path!r}")
+                pcm = proc.stdout
+                if len(pcm) <= self.MaxCacheBytes // 4:
+                    self.cache[key] = pcm
+            return pcm
+
+    def play(self, id, path, volume=1.0, on_end=None):
+        """Start playing the sound at path (non-blocking). Returns a Clip, whose done event is set
+        when it finishes. on_end is called with the Clip when it finishes or is stopped."""
+        clip = Clip(id, self.decode(path), max(0.0, float(volume)), on_end)
+        with self.cond:
+            if self.thread is None:
+                self.halt = False
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.clips.append(clip)
+            self.cond.notify()
+        return clip
+
+    def playing(self):
+        with self.cond:
+            return list(self.clips)
+
+    def interrupt(self, clips):
+        """Stop clips from playing"""
+        with self.cond:
+            stopped = [x for x in clips if x in self.clips]
+            self.clips = [x for x in self.clips if x not in stopped]
+        for clip in stopped:
+            clip.finish(interrupted=True)
+
+    def stop(self, wait=False):
+        """Stop the mixing thread, first waiting for sounds to finish if wait is True"""
+        if wait:
+            [x.done.wait() for x in self.playing()]
+        self.interrupt(self.playing())
+        with self.cond:
+            self.halt = True
+            self.cond.notify()
+            thread = self.thread
+        if thread is not None:
+            thread.join()
+        with self.cond:
+            self.thread = None
+        if self.sink is not None:
+            self.sink.close()
+
+    def run(self):
+        log.debug("Mixer.run BEGIN")
+        if self.sink is None:
+            self.sink = AudioSink(self.Rate, self.Channels, self.Width, lead=self.Lead)
+        while True:
+            with self.cond:
+                while len(self.clips) == 0 and not self.halt:
+                    self.cond.wait()
+                if self.halt:
+                    break
+                block, finished = self.mix()
+            if not self.sink.paced_write(block):
+                log.warning("Mixer: audio sink failed")
+            for clip in finished:
+                # call back once the end of the clip should have been heard
+                delay = self.sink.remaining()
+                if delay > 0:
+                    self.timers.call_later(delay, clip.finish, False, name=f"Mixer.finish {clip.id}")
+                else:
+                    clip.finish(False)
+        log.debug("Mixer.run END")
+
+    def mix(self):
+        """Returns the next block of mixed audio, and a list of clips which have ended. Must be
+        called with the lock held."""
+        mixed = None
+        finished = list()
+        for clip in self.clips:
+            if clip.started is None:
+                clip.started = time.monotonic()
+                clip.started_wall = time.time()
+            part = clip.pcm[clip.pos : clip.pos + self.block_size]
+            clip.pos += len(part)
+            if len(part) < self.block_size:
+                part = part + bytes(self.block_size - len(part))
+                finished.append(clip)
+            if clip.volume != 1.0:
+                part = audioop.mul(part, self.Width, clip.volume)
+            mixed = part if mixed is None else audioop.add(mixed, part, self.Width)
+        self.clips = [x for x in self.clips if x not in finished]
+        return mixed, finished
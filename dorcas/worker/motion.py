@@ -0,0 +1,144 @@
+# Built-in modules
+import logging
+import heapq
+import itertools
+import threading
+import time
+
+# PIP-installed modules
+from singleton_decorator import singleton
+
+
+log = logging.getLogger(__name__)
+
+
+# Easing curves, mapping the fraction of time through a move to the fraction of the distance
+Easings = {
+    "linear": lambda x: x,
+    "in": lambda x: x * x,
+    "out": lambda x: 1 - (1 - x) * (1 - x),
+    "in_out": lambda x: x * x * (3 - 2 * x),
+}
+
+# Easing curves are looked up in tables rather than calculated on every step
+EasingTableSize = 256
+EasingTables = {k: tuple([fn(i / EasingTableSize) for i in range(EasingTableSize + 1)]) for k, fn in Easings.items()}
+
+
+class Track:
+    """A sequence of keyframes for one fader, played by the MotionScheduler.
+
+    keyframes is a list of (seconds from the start, value, easing) in time order, where easing is
+    the name of the curve used to get to that keyframe from the previous one. The fader starts from
+    start_value (or jumps straight to the first keyframe if that's None)."""
+
+    def __init__(self, fader, start_value, keyframes, interval):
+        self.fader = fader
+        self.interval = interval
+        self.keyframes = list(keyframes)
+        if start_value is not None:
+            self.keyframes.insert(0, (0.0, start_value, "linear"))
+        self.duration = self.keyframes[-1][0]
+        self.segment = 0
+        self.start = None
+        self.cancelled = False
+        self.done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the track has finished (or been cancelled)"""
+        return self.done.wait(timeout)
+
+    def value_at(self, t):
+        """The value t seconds from the start. t must not go backwards between calls."""
+        kf = self.keyframes
+        while self.segment < len(kf) - 1 and kf[self.segment + 1][0] <= t:
+            self.segment += 1
+        if self.segment >= len(kf) - 1:
+            return kf[-1][1]
+        t0, v0, _ = kf[self.segment]
+        t1, v1, easing = kf[self.segment + 1]
+        fraction = (t - t0) / (t1 - t0)
+        return v0 + (v1 - v0) * EasingTables[easing][int(fraction * EasingTableSize)]
+
+    @property
+    def final_value(self):
+        return self.keyframes[-1][1]
+
+
+@singleton
+class MotionScheduler:
+    """Plays Tracks for all the faders from one thread.
+
+    Steps are kept in a heap ordered by when they're due. Each step works out the value from the
+    time since the track started, so late steps don't make moves take longer. Starting a new track
+    for a fader cancels its old one, which just marks it: its remaining steps are dropped when they
+    come off the heap."""
+
+    def __init__(self):
+        log.info(f"{self.__class__.__name__}.__init__")
+        self.cond = threading.Condition()
+        self.heap = list()
+        self.counter = itertools.count()
+        self.tracks = dict()  # id(fader): Track
+        self.thread = None
+
+    def play(self, track):
+        with self.cond:
+            self.cancel_locked(track.fader)
+            track.start = time.monotonic()
+            self.tracks[id(track.fader)] = track
+            heapq.heappush(self.heap, (track.start, next(self.counter), track))
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, daemon=True)
+                self.thread.start()
+            self.cond.notify()
+        return track
+
+    def cancel(self, fader):
+        with self.cond:
+            self.cancel_locked(fader)
+
+    def cancel_locked(self, fader):
+        track = self.tracks.pop(id(fader), None)
+        if track is not None:
+            track.cancelled = True
+            track.done.set()
+
+    def moving(self, fader):
+        with self.cond:
+            return id(fader) in self.tracks
+
+    def run(self):
+        with self.cond:
+            while True:
+                if len(self.heap) == 0:
+                    self.cond.wait()
+                    continue
+                due, _, track = self.heap[0]
+                if track.cancelled:
+                    heapq.heappop(self.heap)
+                    continue
+                now = time.monotonic()
+                if due > now:
+                    self.cond.wait(due - now)
+                    continue
+                heapq.heappop(self.heap)
+                # pins are set with the lock held, so a cancelled track can never set one after
+                # its replacement has started
+                try:
+                    self.step(track, now, due)
+                except Exception as e:
+                    log.exception(f"MotionScheduler: step for {track.fader!r}")
+                    self.cancel_locked(track.fader)
+
+    def step(self, track, now, due):
+        t = now - track.start
+        if t >= track.duration:
+            track.fader.set(track.final_value)
+            del self.tracks[id(track.fader)]
+            track.done.set()
+            track.fader.track_done(track)
+            return
+        track.fader.set(int(track.value_at(t)))
+        # keep to the original schedule unless we've fallen behind it
+        heapq.heappush(self.heap, (max(due + track.interval, now), next(self.counter), track))
@@ -1,14 +1,16 @@
 # Built-in python modules
 import re
 import time
+import threading
+from collections import deque
 
 # PIP-installed modules
 import paho.mqtt.client as mqtt
-import paho.mqtt.publish as publish
 import cachetools.func
 from singleton_decorator import singleton
 
 # Project modules
+from dorcas.content import Content
 from dorcas.sensation import Sensation
 from dorcas.database import *
 from dorcas.worker import Worker
@@ -19,7 +21,18 @@ log = logging.getLogger(__name__)
 
 @singleton
 class MqttClient(Worker):
-    """MQTT client configured as per config in database"""
+    """MQTT client configured as per config in database
+
+    Messages are published over the same long-lived connection used for subscriptions. The paho
+    network thread does the actual sending, so publish() doesn't block. Messages published before
+    the connection is up are held in the outbox and sent on connection. The outbox only keeps the
+    latest OutboxSize messages, so a long outage doesn't end with a flood of stale ones."""
+
+    # Max seconds to wait for outstanding messages to be sent when stopping
+    FlushTimeout = 3.0
+    # Sensor traffic doesn't warrant QoS 2 round-trips
+    SubscribeQos = 0
+    OutboxSize = 50
 
     def __init__(self, brain):
         log.info(f"Worker {self.__class__.__name__}.__init__")
@@ -34,15 +47,14 @@ class MqttClient(Worker):
         self.client.on_connect = self.cb_connect
         self.client.on_connect_fail = self.cb_connect_fail
         self.client.on_message = self.cb_message
+        self.client.on_publish = self.cb_publish
         self.receivers = set()
-
-    @property
-    @cachetools.func.ttl_cache(ttl=23)
-    def ignores(self):
-        ignore_list = list()
-        for rec in DB().session.query(Ignore).all():
-            ignore_list.append((re.compile(rec.topic_re), re.compile(rec.message_re)))
-        return ignore_list
+        self.lock = threading.RLock()
+        self.outbox = deque(maxlen=self.OutboxSize)
+        self.unconfirmed = deque()
+        self.confirmed = 0
+        self.subscribed = set()
+        Content().add_listener(self.update_subscriptions)
 
     @property
     @cachetools.func.ttl_cache(ttl=23)
@@ -64,16 +76,16 @@ class MqttClient(Worker):
         log.debug(f"connect code={code!r}")
         code = self.client.loop_start()
         log.debug(f"loop_start code={code!r}")
-        self.client.subscribe("#", 2)
 
     def stop(self):
         log.debug(f"mqtt.stop")
-        # TODO: shut down MQTT client thread properly
-        pass
+        self.flush(self.FlushTimeout)
+        self.client.disconnect()
+        self.client.loop_stop()
 
     def wait(self):
         log.debug(f"mqtt.wait")
-        # TODO: shut down MQTT client thread properly
+        # nothing to do: stop() has already joined the network thread (in loop_stop)
         pass
 
     def run(self):
@@ -88,13 +100,90 @@ class MqttClient(Worker):
     def unregister_receiver(self, fn):
         self.receivers.remove(fn)
 
-    def publish(self, topic, message):
-        if not self.brain.get("mute_mqtt"):
-            log.debug("MqttClient.publish topic={topic!r} message={message!r}")
-            publish.single(topic, message, hostname=self.mqtt_host, port=self.mqtt_port)
+    def publish(self, topic, message, qos=0, retain=False):
+        """Queue a message for publishing (non-blocking).
+
+        Returns a paho MQTTMessageInfo which can be used to wait for delivery, or None if the message
+        is muted or held in the outbox until the broker connection is made."""
+        if self.brain.get("mute_mqtt"):
+            return None
+        log.debug(f"MqttClient.publish topic={topic!r} message={message!r} qos={qos}")
+        with self.lock:
+            if not self.client.is_connected():
+                self.outbox.append((topic, message, qos, retain))
+                return None
+            return self._publish(topic, message, qos, retain)
+
+    def _publish(self, topic, message, qos, retain):
+        info = self.client.publish(topic, message, qos=qos, retain=retain)
+        if info.rc == mqtt.MQTT_ERR_NO_CONN:
+            # the connection dropped since publish() checked, so send it when it's back
+            log.debug(f"MqttClient.publish topic={topic!r}: not connected, holding in outbox")
+            self.outbox.append((topic, message, qos, retain))
+            return None
+        if info.rc != mqtt.MQTT_ERR_SUCCESS:
+            log.warning(f"MqttClient.publish topic={topic!r} failed: {mqtt.error_string(info.rc)}")
+            return info
+        self.unconfirmed.append(info)
+        return info
+
+    def flush(self, timeout):
+        """Wait up to timeout seconds for unconfirmed messages to be sent."""
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            waiting = list(self.unconfirmed)
+        for info in waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                info.wait_for_publish(remaining)
+            except (RuntimeError, ValueError) as e:
+                log.warning(f"MqttClient.flush: {e}")
+        log.debug(f"MqttClient.flush: confirmed={self.confirmed} unconfirmed={len(self.unconfirmed)} outbox={len(self.outbox)}")
+
+    def cb_publish(self, client, user_data, mid, reason_code=None, properties=None):
+        # called from the paho network thread; deque append/popleft are thread safe
+        # exceptions here would kill the network thread, so drop anything which can't be checked
+        self.confirmed += 1
+        while len(self.unconfirmed) > 0:
+            try:
+                if not self.unconfirmed[0].is_published():
+                    break
+            except (RuntimeError, ValueError) as e:
+                log.warning(f"MqttClient: dropping unconfirmed message: {e}")
+            self.unconfirmed.popleft()
+
+    def update_subscriptions(self, resubscribe=False):
+        """Subscribe to the topics the brain needs, and unsubscribe from those it no longer needs.
+
+        If resubscribe is True, subscribe to everything (e.g. after a new connection)."""
+        with self.lock:
+            wanted = set(self.brain.subscriptions())
+            old = set() if resubscribe else self.subscribed
+            self.subscribed = wanted
+            if not self.client.is_connected():
+                return
+            unwanted = sorted(old - wanted)
+            new = sorted(wanted - old)
+            if len(unwanted) > 0:
+                log.info(f"MQTT unsubscribe: {', '.join(unwanted)}")
+                self.client.unsubscribe(unwanted)
+            if len(new) > 0:
+                log.info(f"MQTT subscribe: {', '.join(new)}")
+                self.client.subscribe([(x, self.SubscribeQos) for x in new])
 
     def cb_connect(self, *args):
         log.info(f"MQTT connect success")
+        self.update_subscriptions(resubscribe=True)
+        with self.lock:
+            if len(self.outbox) > 0:
+                log.debug(f"MqttClient: sending {len(self.outbox)} messages from outbox")
+            # _publish puts messages back in the outbox if the connection drops again
+            held = list(self.outbox)
+            self.outbox.clear()
+            for message in held:
+                self._publish(*message)
 
     def cb_connect_fail(self, *args):
         self.experience(
@@ -107,22 +196,18 @@ class MqttClient(Worker):
     def cb_message(self, client, user_data, message, properties=None):
         if len(self.receivers) == 0:
             return
-        str_message = (
-            message.payload.decode(errors="ignore")
-            if type(message.payload) is bytes
-            else str(message.payload)
-        )
-        desc = f"topic={message.topic!r} message={str_message!r}"
-        if self.drop(message.topic, str_message):
-            log.log(logging.DEBUG - 1, f"MQTT ignore message: {desc}")
+        # the Sensation keeps the raw payload, and decodes it once, when first needed
+        s = Sensation(message.topic, message.payload)
+        rule = self.drop(s.topic, s.message)
+        if rule is not None:
+            if log.isEnabledFor(logging.DEBUG - 1):
+                log.log(logging.DEBUG - 1, f"MQTT ignore message (rule #{rule}): {s!r}")
             return
-        log.log(logging.DEBUG - 1, f"MQTT message: {desc}")
-        s = Sensation(message.topic, str_message)
+        if log.isEnabledFor(logging.DEBUG - 1):
+            log.log(logging.DEBUG - 1, f"MQTT message: {s!r}")
         for receiver in self.receivers:
             receiver(s)
 
     def drop(self, topic, message):
-        for trx, mrx in self.ignores:
-            if trx.match(topic) and mrx.match(message):
-                return True
-        return False
+        """Returns the id of the Ignore rule which matches, or None if the message should be kept"""
+        return Content().ignores.match(topic, message)
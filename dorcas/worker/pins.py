@@ -0,0 +1,147 @@
+# Built-in modules
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+
+log = logging.getLogger(__name__)
+
+
+class PigpioPins:
+    """Drives pins through pigpiod, connecting in the background.
+
+    Nothing waits for pigpiod: until there's a connection (or while reconnecting after pigpiod
+    has gone away) the latest state of each pin is remembered, and set when the connection is
+    made. Connection attempts are retried every RetryInterval seconds."""
+
+    RetryInterval = 5.0
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pigpio = None
+        self.pi = None
+        self.state = dict()  # (pin, what): value, in the order first set
+        self.wake = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    @property
+    def connected(self):
+        return self.pi is not None
+
+    def run(self):
+        try:
+            import pigpio
+        except ImportError:
+            log.warning("pigpio module not installed - pins will not be driven")
+            return
+        self.pigpio = pigpio
+        warned = False
+        while True:
+            if self.pi is not None:
+                # wait until a call fails
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            pi = pigpio.pi(show_errors=False)
+            if not pi.connected:
+                if not warned:
+                    log.warning(f"pigpio not connected - will keep trying every {self.RetryInterval}s")
+                    warned = True
+                pi.stop()
+                time.sleep(self.RetryInterval)
+                continue
+            with self.lock:
+                self.pi = pi
+                log.info("pigpio connected")
+                warned = False
+                # bring the pins up to date
+                for (pin, what), value in list(self.state.items()):
+                    self.apply(pin, what, value)
+
+    def apply(self, pin, what, value):
+        """Set a pin. Must be called with the lock held."""
+        if self.pi is None:
+            return
+        try:
+            if what == "output":
+                self.pi.set_mode(pin, self.pigpio.OUTPUT if value else self.pigpio.INPUT)
+            elif what == "servo":
+                self.pi.set_servo_pulsewidth(pin, value)
+            elif what == "pwm":
+                self.pi.set_PWM_dutycycle(pin, value)
+        except Exception as e:
+            log.warning(f"pigpio: {e} - reconnecting")
+            try:
+                self.pi.stop()
+            except Exception:
+                pass
+            self.pi = None
+            self.wake.set()
+
+    def set(self, pin, what, value):
+        with self.lock:
+            if self.state.get((pin, what)) == value and what == "output":
+                return
+            self.state[(pin, what)] = value
+            self.apply(pin, what, value)
+
+    def set_output(self, pin, output):
+        self.set(pin, "output", output)
+
+    def set_servo(self, pin, value):
+        self.set(pin, "servo", value)
+
+    def set_pwm(self, pin, value):
+        self.set(pin, "pwm", value)
+
+
+class SimulatedPins:
+    """Pretends to drive pins, remembering what was done to them, e.g. for tests, or for running
+    without the hardware. history is a list of (monotonic time, pin, what, value)."""
+
+    HistoryLength = 10000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.outputs = dict()
+        self.values = dict()
+        self.history = deque(maxlen=self.HistoryLength)
+
+    def record(self, pin, what, value):
+        with self.lock:
+            self.history.append((time.monotonic(), pin, what, value))
+
+    def set_output(self, pin, output):
+        self.outputs[pin] = output
+        self.record(pin, "output", output)
+
+    def set_servo(self, pin, value):
+        self.values[pin] = value
+        self.record(pin, "servo", value)
+
+    def set_pwm(self, pin, value):
+        self.values[pin] = value
+        self.record(pin, "pwm", value)
+
+
+Backends = {"pigpio": PigpioPins, "simulated": SimulatedPins}
+Current = None
+
+
+def use_pins(name):
+    """Choose the pin backend (see Backends). Must be called before pins() is first used to have
+    any effect."""
+    global Current
+    if Current is None:
+        Current = Backends[name]()
+        log.info(f"pins: using {name} backend")
+    return Current
+
+
+def pins():
+    """The pin backend, chosen by $DORCAS_PINS ("pigpio" by default, or "simulated"), created the
+    first time it's needed"""
+    return Current if Current is not None else use_pins(os.environ.get("DORCAS_PINS", "pigpio"))
@@ -0,0 +1,115 @@
+# Python built-in modules
+import os
+import sys
+import threading
+import logging
+from collections import deque
+
+# PIP-installed modules
+from singleton_decorator import singleton
+
+# Project modules
+from dorcas.content import Content
+from dorcas.responder.time import Time
+from dorcas.worker import Worker
+from dorcas.worker.speechcache import SpeechCache
+from dorcas.worker.thespian import Thespian
+from dorcas.worker.voice import Gob, split_utterance
+
+
+log = logging.getLogger(__name__)
+
+
+@singleton
+class Rehearsal(Worker):
+    """Renders predictable utterances into the speech cache while the urchin is idle.
+
+    Utterances come from the hourly announcements, and constant say() calls in greeting and musing
+    actions. Rendering is done at low CPU priority, and abandoned as soon as there's something else
+    to do (it will be tried again later)."""
+
+    # Seconds between checks for idleness
+    Interval = 2.0
+    # Niceness increment for render processes
+    Nice = 19
+
+    def __init__(self, brain):
+        log.info(f"Worker {self.__class__.__name__}.__init__")
+        super().__init__(brain)
+        self.wake = threading.Event()
+        self.script = deque()
+        self.rebuild = True
+        Content().add_listener(self.content_changed)
+
+    def content_changed(self):
+        self.rebuild = True
+        self.wake.set()
+
+    def stop(self):
+        super().stop()
+        self.wake.set()
+
+    def run(self):
+        log.info(f"{self.__class__.__name__}.run BEGIN")
+        while not self.halt:
+            if self.rebuild:
+                self.rebuild = False
+                self.script = deque(self.gather())
+                log.debug(f"Rehearsal: {len(self.script)} utterances to rehearse")
+            if len(self.script) == 0 or not self.idle():
+                # with nothing left to rehearse, wait for new content
+                self.wake.wait(None if len(self.script) == 0 else self.Interval)
+                self.wake.clear()
+                continue
+            text, voice_id = self.script[0]
+            voice = Content().voices.get(voice_id or self.brain.get("default_voice"))
+            if voice is None or SpeechCache().has(text, voice) or self.rehearse(text, voice):
+                self.script.popleft()
+        log.info(f"{self.__class__.__name__}.run END")
+
+    def gather(self):
+        """Returns a list of (text, voice_id) with no duplicates"""
+        lines = [(Time.hour_text(hour), None) for hour in range(24)]
+        lines.extend(Content().says)
+        if Gob().Pipelined:
+            # the Gob renders (and so caches) a sentence at a time
+            lines = [(chunk, voice_id) for text, voice_id in lines for chunk in split_utterance(text)]
+        return list(dict.fromkeys(lines))
+
+    def idle(self):
+        return (
+            not self.brain.get("silence")
+            and len(self.brain.sensations) == 0
+            and not Gob().is_talking
+            and Thespian().current is None
+            and len(Thespian().queue) == 0
+        )
+
+    def rehearse(self, text, voice):
+        """Render text in the background, giving up if the urchin has something else to do.
+
+        Returns False if rehearsal was abandoned and should be tried again later."""
+        procs = list()
+        result = list()
+
+        def render():
+            result.append(SpeechCache().render(text, voice, nice=self.Nice, on_start=procs.extend))
+
+        thread = threading.Thread(target=render)
+        thread.start()
+        backed_off = False
+        while thread.is_alive():
+            thread.join(0.05)
+            if not backed_off and (self.halt or not self.idle()):
+                log.debug(f"Rehearsal: backing off from {text!r}")
+                backed_off = True
+            if backed_off:
+                # keep killing in case the render processes started after we decided to back off
+                [x.kill() for x in procs if x.poll() is None]
+        if backed_off:
+            return False
+        if len(result) > 0 and result[0] is not None:
+            log.debug(f"Rehearsal: rendered v={voice.id!r} {text!r}")
+        else:
+            log.warning(f"Rehearsal: could not render v={voice.id!r} {text!r}")
+        return True
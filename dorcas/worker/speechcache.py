@@ -0,0 +1,239 @@
+# Python built-in modules
+import os
+import sys
+import threading
+import subprocess as sp
+import logging
+import hashlib
+import json
+import wave
+
+# PIP-installed modules
+from singleton_decorator import singleton
+
+# Project modules
+from dorcas.paths import cache_dir
+from dorcas.worker.larynx import Larynx, raw_format
+
+
+log = logging.getLogger(__name__)
+
+
+def make_speech_cmd(text, voice):
+    """Get speech engine command"""
+    cmd = [voice.engine]
+    cmd.extend(["-v", voice.voice])
+    cmd.extend(["-s", str(voice.speed)])
+    cmd.extend(["-p", str(voice.pitch)])
+    cmd.extend(["-a", str(voice.amplitude)])
+    cmd.extend(["-w", "/dev/stdout"])
+    cmd.append(text)
+    return cmd
+
+
+def make_effect_cmd(effect):
+    return ["play"] + effect.args.split()
+
+
+def make_render_cmd(effect, path, input_format=None):
+    """Get a sox command which applies effect to speech on stdin, writing the result to path.
+
+    Effect args are written for play, e.g. "-t wav -v 0.6 - -q pitch 600 reverb", i.e. input
+    options, the input file "-", then global options and effects. sox needs the output file to go
+    between the options and the effects. If input_format is given (e.g. from raw_format()), it
+    replaces any input file type in the effect args."""
+    args = effect.args.split()
+    if "-" in args:
+        idx = args.index("-") + 1
+        inputs = args[:idx]
+    else:
+        idx = 0
+        inputs = ["-t", "wav", "-"]
+    if input_format is not None:
+        while "-t" in inputs[:-1]:
+            t = inputs.index("-t")
+            del inputs[t : t + 2]
+        inputs = input_format + inputs
+    options = list()
+    while idx < len(args) and args[idx].startswith("-"):
+        options.append(args[idx])
+        idx += 1
+    return ["sox"] + options + inputs + ["-t", "wav", path] + args[idx:]
+
+
+def has_effects(effect):
+    """True if effect changes the sound at all (input volume counts), i.e. sox is needed to apply it"""
+    if effect is None:
+        return False
+    args = effect.args.split()
+    if "-" not in args:
+        return len(args) > 0
+    idx = args.index("-")
+    inputs = args[:idx]
+    # an input file type on its own doesn't change the sound
+    while "-t" in inputs[:-1]:
+        t = inputs.index("-t")
+        del inputs[t : t + 2]
+    idx += 1
+    while idx < len(args) and args[idx].startswith("-"):
+        if args[idx] != "-q":
+            return True
+        idx += 1
+    return len(inputs) > 0 or idx < len(args)
+
+
+@singleton
+class SpeechCache:
+    """A size-bounded, on-disk cache of rendered speech, with effects applied.
+
+    Files are named by a hash of the text and everything about the voice and effect which changes
+    the sound, so a change to a voice in the database just makes new entries. The least recently
+    used files are removed when the cache grows beyond MaxBytes."""
+
+    MaxBytes = 64 * 1024 * 1024
+
+    def __init__(self, path=None, max_bytes=MaxBytes):
+        self.path = cache_dir("speech") if path is None else path
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.size = sum([x.stat().st_size for x in os.scandir(self.path) if x.name.endswith(".wav")])
+        log.info(f"SpeechCache: {self.path} ({self.size} bytes)")
+
+    def key(self, text, voice):
+        return hashlib.sha256(
+            json.dumps(
+                [
+                    text,
+                    voice.engine,
+                    voice.voice,
+                    voice.speed,
+                    voice.pitch,
+                    voice.amplitude,
+                    voice.gap,
+                    voice.effect.args,
+                ]
+            ).encode()
+        ).hexdigest()
+
+    def file_path(self, key):
+        return os.path.join(self.path, f"{key}.wav")
+
+    def has(self, text, voice):
+        """Like get(), but doesn't count as a use"""
+        return os.path.exists(self.file_path(self.key(text, voice)))
+
+    def get(self, text, voice):
+        """Returns the path of the rendered speech, or None if it's not in the cache"""
+        path = self.file_path(self.key(text, voice))
+        try:
+            # mtime is used as the last-used time for eviction
+            os.utime(path)
+            self.hits += 1
+            return path
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+    def render(self, text, voice, nice=0, on_start=None):
+        """Render text into the cache (blocking). Returns the path, or None on failure.
+
+        Speech comes from the long-lived speech engine for the voice, unless nice is set (the
+        engine is shared, so it can't be given a lower priority or killed part-way through). Its
+        output is written straight to the cache if the voice has no effects, otherwise it goes
+        through sox (a process per render: sox effects like reverb can't be applied in-process,
+        and a long-lived sox can't mark where one utterance's output ends).
+
+        nice - niceness increment for the render processes
+        on_start - called with the list of render processes once they've started (e.g. so they
+                   can be killed by someone else)
+        """
+        path = self.file_path(self.key(text, voice))
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        try:
+            ok = False
+            if not nice:
+                ok = self.render_with_engine(text, voice, tmp, on_start)
+            if not ok:
+                ok = self.render_with_procs(text, voice, tmp, nice, on_start)
+            if not ok:
+                log.warning(f"SpeechCache.render failed for {text!r}")
+                return None
+            size = os.path.getsize(tmp)
+            os.replace(tmp, path)
+        finally:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        with self.lock:
+            self.size += size
+        self.evict()
+        return path
+
+    def render_with_engine(self, text, voice, tmp, on_start):
+        try:
+            rate, channels, width, pcm = Larynx().engine(voice).synthesize(text)
+        except RuntimeError as e:
+            log.warning(f"SpeechCache.render_with_engine: {e}")
+            return False
+        if not has_effects(voice.effect):
+            with wave.open(tmp, "wb") as w:
+                w.setnchannels(channels)
+                w.setsampwidth(width)
+                w.setframerate(rate)
+                w.writeframes(pcm)
+            return True
+        render_proc = sp.Popen(
+            make_render_cmd(voice.effect, tmp, raw_format(rate, channels, width)), stdin=sp.PIPE
+        )
+        try:
+            if on_start:
+                on_start([render_proc])
+            try:
+                render_proc.communicate(pcm)
+            except BrokenPipeError:
+                pass
+            return render_proc.wait() == 0
+        finally:
+            if render_proc.poll() is None:
+                render_proc.kill()
+                render_proc.wait()
+
+    def render_with_procs(self, text, voice, tmp, nice, on_start):
+        preexec = (lambda: os.nice(nice)) if nice else None
+        speech_proc = None
+        render_proc = None
+        try:
+            speech_proc = sp.Popen(make_speech_cmd(text, voice), stdout=sp.PIPE, preexec_fn=preexec)
+            render_proc = sp.Popen(
+                make_render_cmd(voice.effect, tmp), stdin=speech_proc.stdout, preexec_fn=preexec
+            )
+            speech_proc.stdout.close()
+            if on_start:
+                on_start([speech_proc, render_proc])
+            return render_proc.wait() == 0 and speech_proc.wait() == 0
+        finally:
+            for p in (speech_proc, render_proc):
+                if p is not None and p.poll() is None:
+                    p.kill()
+                    p.wait()
+
+    def evict(self):
+        with self.lock:
+            if self.size <= self.max_bytes:
+                return
+            entries = sorted(
+                [x for x in os.scandir(self.path) if x.name.endswith(".wav")],
+                key=lambda x: x.stat().st_mtime,
+            )
+            self.size = sum([x.stat().st_size for x in entries])
+            for entry in entries:
+                if self.size <= self.max_bytes:
+                    break
+                try:
+                    size = entry.stat().st_size
+                    os.remove(entry.path)
+                    self.size -= size
+                    log.debug(f"SpeechCache.evict {entry.name}")
+                except FileNotFoundError:
+                    pass
@@ -10,7 +10,8 @@ import re
 import copy
 import glob
 import random
-from collections import deque
+import types
+from collections import deque, ChainMap
 
 # PIP-installed modules
 from singleton_decorator import singleton
@@ -18,6 +19,7 @@ import cachetools.func
 
 # Project modules
 from dorcas import database
+from dorcas.codecache import CodeCache
 from dorcas.worker import Worker
 from dorcas.worker.voice import Voice
 from dorcas.worker.audio import Audio
@@ -41,6 +43,9 @@ class ActionRunner:
     def audio_find(*args, **kwargs):
         return Audio().find(*args, **kwargs)
 
+    def audio_info(*args, **kwargs):
+        return Audio().info(*args, **kwargs)
+
     def eyes(final, duration=0.5):
         return Eyes().fade_to(final, duration)
 
@@ -57,6 +62,7 @@ class ActionRunner:
         "alien_show": alien_show,
         "alien_hide": alien_hide,
         "audio_find": audio_find,
+        "audio_info": audio_info,
         "eyes": eyes,
         "log": log.info,
         "pause": time.sleep,
@@ -70,16 +76,16 @@ class ActionRunner:
 
     def run(self, act):
         try:
-            context = copy.deepcopy({} if act.state is None else act.state)
-            for k, v in self.FunctionMap.items():
-                context[k] = v
+            # variables set by the program land in the empty top layer, leaving act.state untouched
+            context = ChainMap({}, self.FunctionMap, {} if act.state is None else act.state)
             eval(self.compile(act.program), {}, context)
         except Exception as e:
             log.exception(f"while running action {act!r}")
 
     def compile(self, program):
-        tree = ast.parse(program)
-        return compile(tree, "<string>", "exec")
+        if type(program) is types.CodeType:
+            return program
+        return CodeCache().compile(program, "exec")
 
 
 @singleton
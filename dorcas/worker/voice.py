@@ -7,6 +7,7 @@ import logging
 import re
 import json
 import time
+import queue
 from collections import deque
 
 # PIP-installed modules
@@ -14,34 +15,70 @@ from singleton_decorator import singleton
 import arrow
 
 # Project modules
-from dorcas.database import DB, Voice as VoiceTable
-from dorcas import database
+from dorcas.content import Content
+from dorcas.sensation import Sensation
 from dorcas.worker import Worker
 from dorcas.worker.eyes import Eyes
+from dorcas.worker.larynx import Larynx
 from dorcas.worker.mqttclient import MqttClient
+from dorcas.worker.speechcache import SpeechCache, make_speech_cmd, make_effect_cmd
 
 log = logging.getLogger(__name__)
 
 
-def make_speech_cmd(text, voice):
-    """Get speech engine command"""
-    cmd = [voice.engine]
-    cmd.extend(["-v", voice.voice])
-    cmd.extend(["-s", str(voice.speed)])
-    cmd.extend(["-p", str(voice.pitch)])
-    cmd.extend(["-a", str(voice.amplitude)])
-    cmd.extend(["-w", "/dev/stdout"])
-    cmd.append(text)
-    return cmd
+# Words ending in "." which don't end a sentence (compared without the ".", in lower case)
+Abbreviations = frozenset(["mr", "mrs", "ms", "dr", "prof", "st", "jr", "sr", "vs", "etc", "approx", "cf"])
 
 
-def make_effect_cmd(effect):
-    return ["play"] + effect.args.split()
+def is_abbreviation(word):
+    """True if word (perhaps after opening punctuation) is an abbreviation such as Mr. or e.g., or
+    an initial such as J."""
+    word = word.lstrip("(\"'")
+    if not word.endswith("."):
+        return False
+    stem = word[:-1]
+    return stem.lower() in Abbreviations or re.fullmatch(r"(?:[A-Za-z]\.)+[A-Za-z]|[A-Z]", stem) is not None
+
+
+def split_sentences(text):
+    """Split text after sentence-ending punctuation, but not after abbreviations"""
+    sentences = list()
+    start = 0
+    for m in re.finditer(r"(?<=[.!?])\s+", text):
+        if is_abbreviation(text[start : m.start()].split()[-1]):
+            continue
+        sentences.append(text[start : m.start()])
+        start = m.end()
+    sentences.append(text[start:])
+    return [x for x in sentences if len(x) > 0]
+
+
+def split_utterance(text, max_length=120):
+    """Split text into sentences, and long sentences into clauses, so the first part can be
+    playing while the rest are being synthesized. Returns [] if there's nothing to say."""
+    chunks = list()
+    for sentence in split_sentences(text.strip()):
+        if len(sentence) <= max_length:
+            chunks.append(sentence)
+            continue
+        for clause in [x for x in re.split(r"(?<=[,;:])\s+", sentence) if len(x) > 0]:
+            # don't make lots of tiny fragments out of lists
+            if len(chunks) > 0 and len(chunks[-1]) + len(clause) < max_length // 2:
+                chunks[-1] += " " + clause
+            else:
+                chunks.append(clause)
+    return chunks
 
 
 @singleton
 class Gob:
-    """The Gob is an interruptable utterer of text in a specified voice."""
+    """The Gob is an interruptable utterer of text in a specified voice.
+
+    In pipelined mode, text is split into sentences (see split_utterance) and the next one is
+    rendered into the speech cache while the current one plays. Rendered speech is played through
+    a long-lived audio sink (see Larynx)."""
+
+    Pipelined = True
 
     def __init__(self, brain):
         log.info(f"Worker {self.__class__.__name__}.__init__")
@@ -49,8 +86,10 @@ class Gob:
         self.is_talking = False
         self.speech_proc = None
         self.effect_proc = None
+        self.render_procs = list()
         self.thread = None
         self.last_text = ""
+        self.interrupted = False
 
     def utter(self, text, voice):
         """start speaking (non-blocking)"""
@@ -61,10 +100,22 @@ class Gob:
         self.thread.start()
         return True
 
+    def prefetch(self, text, voice):
+        """Start rendering the beginning of text in the background (e.g. for the next thing in the
+        queue), so it's ready to play when it's time to say it."""
+        chunks = split_utterance(text) if self.Pipelined else [text]
+        if len(chunks) == 0:
+            return
+        chunk = chunks[0]
+        if not SpeechCache().has(chunk, voice):
+            threading.Thread(target=SpeechCache().render, args=(chunk, voice)).start()
+
     def interrupt(self):
         if self.is_talking:
-            [x.kill() for x in (self.speech_proc, self.effect_proc) if x is not None]
-            [x.wait() for x in (self.speech_proc, self.effect_proc) if x is not None]
+            self.interrupted = True
+            procs = [x for x in [self.speech_proc, self.effect_proc] + self.render_procs if x is not None]
+            [x.kill() for x in procs]
+            [x.wait() for x in procs]
             self.brain.experience(
                 Sensation(self.brain.topic("interrupted"), self.last_text)
             )
@@ -82,36 +133,36 @@ class Gob:
         """blocking utterances"""
         if self.is_talking:
             return False
+        if len(text.strip()) == 0:
+            return True
         exc = False
+        ok = True
+        renderer = None
         try:
             self.is_talking = True
+            self.interrupted = False
             self.last_text = text
-            speech_cmd = make_speech_cmd(text, voice)
-            effect_cmd = make_effect_cmd(voice.effect)
-            self.brain.be_polite()
-            log.info(f"saying v={voice.id!r} {text!r}")
-            MqttClient().publish(self.brain.topic("talking"), "voice start")
-            Eyes().fade_to(255, 0.1)
-            log.debug(f"utter: speech cmd: {speech_cmd}")
-            log.debug(f"utter: effect cmd: {effect_cmd}")
-            log.debug(f"UTTER[voice={voice.id}]: {text}")
-            self.speech_proc = sp.Popen(speech_cmd, stdout=sp.PIPE)
-            self.effect_proc = sp.Popen(effect_cmd, stdin=self.speech_proc.stdout)
-            self.speech_proc.stdout.close()
-            self.effect_proc.communicate()[0]
+            chunks = split_utterance(text) if self.Pipelined else [text]
+            rendered = queue.Queue()
+            renderer = threading.Thread(target=self.render_chunks, args=(chunks, voice, rendered))
+            renderer.start()
+            for n, chunk in enumerate(chunks):
+                path = rendered.get()
+                if self.interrupted:
+                    break
+                if n == 0:
+                    self.brain.be_polite()
+                    log.info(f"saying v={voice.id!r} {text!r}")
+                    MqttClient().publish(self.brain.topic("talking"), "voice start")
+                    Eyes().fade_to(255, 0.1)
+                log.debug(f"UTTER[voice={voice.id}]: {chunk}")
+                ok = self.play_chunk(chunk, path, voice) and ok
         except Exception as e:
             log.exception(f"exception while uttering utter")
             exc = True
         finally:
-            ok = True
-            if self.speech_proc:
-                if self.speech_proc.wait() != 0:
-                    ok = False
-                    self.speech_proc = None
-            if self.effect_proc:
-                if self.effect_proc.wait() != 0:
-                    ok = False
-                    self.effect_proc = None
+            if renderer is not None:
+                renderer.join()
             self.is_talking = False
             MqttClient().publish(self.brain.topic("said"), text)
             log.info(f"said{' [exc]' if exc else ''}   v={voice.id!r} {text!r}")
@@ -119,36 +170,145 @@ class Gob:
             log.debug(f"utter END ok={ok}")
             return ok
 
+    def render_chunks(self, chunks, voice, rendered):
+        """Render chunks in order, putting their paths (or None if rendering failed) on rendered"""
+        for chunk in chunks:
+            rendered.put(None if self.interrupted else self.render(chunk, voice))
+
+    def play_chunk(self, text, path, voice):
+        """Play rendered speech from path, or if it couldn't be rendered, pipe speech for text
+        straight to the effect player (blocking). Returns True on success."""
+        try:
+            if path is not None:
+                log.debug(f"utter: playing {path}")
+                try:
+                    return Larynx().play_file(path, stop=lambda: self.interrupted)
+                except Exception as e:
+                    log.warning(f"utter: can't play {path} through the audio sink: {e}")
+                    self.effect_proc = sp.Popen(["play", "-q", path])
+            else:
+                speech_cmd = make_speech_cmd(text, voice)
+                effect_cmd = make_effect_cmd(voice.effect)
+                log.debug(f"utter: speech cmd: {speech_cmd}")
+                log.debug(f"utter: effect cmd: {effect_cmd}")
+                self.speech_proc = sp.Popen(speech_cmd, stdout=sp.PIPE)
+                self.effect_proc = sp.Popen(effect_cmd, stdin=self.speech_proc.stdout)
+                self.speech_proc.stdout.close()
+            ok = True
+            for p in (self.speech_proc, self.effect_proc):
+                if p is not None and p.wait() != 0:
+                    ok = False
+            return ok
+        finally:
+            self.speech_proc = None
+            self.effect_proc = None
+
+    def render(self, text, voice):
+        """Get the path to the rendered speech from the speech cache, rendering it if needed.
+
+        Returns None if it couldn't be rendered."""
+        path = SpeechCache().get(text, voice)
+        if path is not None:
+            return path
+        try:
+            return SpeechCache().render(text, voice, on_start=self.set_render_procs)
+        except Exception as e:
+            log.exception(f"while rendering {text!r}")
+            return None
+        finally:
+            self.render_procs = list()
+
+    def set_render_procs(self, procs):
+        # so interrupt() can kill the render
+        self.render_procs = procs
+
 
 @singleton
 class Voice(Worker):
     """A voice queue manager
 
     Actual speaking is done by the Gob() singleton. This class is used to queue up things
-    to say, and split things into chunks with different characteristics."""
+    to say, and split things into chunks with different characteristics.
+
+    Voices come from Content().voices, so nothing here touches the database."""
 
     def __init__(self, brain):
         log.info(f"Worker {self.__class__.__name__}.__init__")
         super().__init__(brain)
         Gob(brain)
-        self.queue = deque()
+        SpeechCache()
+        self.cond = threading.Condition()
+        self.queue = deque()  # (text, voice_id, time queued)
+        self.metrics = {
+            "utterances": 0,
+            "max_depth": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "duration_total": 0.0,
+            "duration_max": 0.0,
+        }
+
+    def stop(self):
+        super().stop()
+        with self.cond:
+            self.cond.notify_all()
+
+    def next_item(self):
+        """Blocks until there's something to say, and returns it. Returns None when halted."""
+        with self.cond:
+            while len(self.queue) == 0 and not self.halt:
+                self.cond.wait()
+            return None if self.halt else self.queue.popleft()
 
     def run(self):
         log.info(f"{self.__class__.__name__}.run BEGIN")
-        while not self.halt:
-            while len(self.queue) > 0:
-                try:
-                    text, voice_id = self.queue.popleft()
-                    voice = DB().session.get(VoiceTable, voice_id)
-                    Gob().wait()
-                    Gob().utter(text, voice)
-                    self.brain.set("last_utterance", arrow.now())
-                    time.sleep(0.25)
-                except Exception as e:
-                    log.exception(f"when trying to speak with voice {voice_id!r}")
-            time.sleep(0.25)
+        while True:
+            item = self.next_item()
+            if item is None:
+                break
+            text, voice_id, queued = item
+            try:
+                voice = Content().voices.get(voice_id)
+                if voice is None:
+                    log.warning(f"no such voice {voice_id!r}, not saying {text!r}")
+                    continue
+                start = time.monotonic()
+                Gob().utter(text, voice)
+                if len(self.queue) > 0:
+                    # get the next thing ready while this one is being said
+                    next_text, next_voice_id, _ = self.queue[0]
+                    if next_voice_id in Content().voices:
+                        Gob().prefetch(next_text, Content().voices[next_voice_id])
+                self.brain.set("last_utterance", arrow.now())
+                Gob().wait()
+                self.record(start - queued, time.monotonic() - start)
+            except Exception as e:
+                log.exception(f"when trying to speak with voice {voice_id!r}")
+        Gob().wait()
+        Larynx().close()
+        log.info(f"voice stats: {self.stats()}")
         log.info(f"{self.__class__.__name__}.run END")
 
+    def record(self, wait, duration):
+        with self.cond:
+            m = self.metrics
+            m["utterances"] += 1
+            m["wait_total"] += wait
+            m["wait_max"] = max(m["wait_max"], wait)
+            m["duration_total"] += duration
+            m["duration_max"] = max(m["duration_max"], duration)
+        log.debug(f"voice: waited {wait:.3f}s, spoke for {duration:.3f}s")
+
+    def stats(self):
+        """Returns a dict of queue depth, and utterance wait time and duration metrics"""
+        with self.cond:
+            m = dict(self.metrics)
+            m["depth"] = len(self.queue)
+        n = max(1, m["utterances"])
+        m["wait_mean"] = m["wait_total"] / n
+        m["duration_mean"] = m["duration_total"] / n
+        return m
+
     def say(self, text, voice=None):
         """queue up something to say.
 
@@ -159,6 +319,9 @@ class Voice(Worker):
         if self.brain.get("silence"):
             log.debug("SILENCED")
             return
-        if voice is None or DB().session.get(VoiceTable, voice) is None:
-            voice = self.brain.config.voice_id
-        self.queue.append((text, voice))
+        if voice not in Content().voices:
+            voice = self.brain.get("default_voice")
+        with self.cond:
+            self.queue.append((text, voice, time.monotonic()))
+            self.metrics["max_depth"] = max(self.metrics["max_depth"], len(self.queue))
+            self.cond.notify()
@@ -0,0 +1,29 @@
+from dorcas.content import IgnoreMatcher
+
+
+def test_no_rules():
+    assert IgnoreMatcher([]).match("a/b", "x") is None
+
+
+def test_match_and_hits():
+    m = IgnoreMatcher([(1, r"a/.*", r"x"), (2, r"b/.*", r".*")])
+    assert m.match("a/1", "x") == 1
+    assert m.match("a/1", "y") is None
+    assert m.match("b/1", "y") == 2
+    assert m.hits == {1: 1, 2: 1}
+
+
+def test_first_rule_wins_across_topic_groups():
+    # rules 1 and 3 share a topic regex, so they're grouped together - rule 2 must still win
+    rules = [(1, r"a/.*", r"nope"), (2, r"a/b", r"x"), (3, r"a/.*", r"x")]
+    m = IgnoreMatcher(rules)
+    assert m.match("a/b", "x") == 2
+    assert m.hits == {1: 0, 2: 1, 3: 0}
+
+
+def test_first_rule_wins_without_combined_regex():
+    # a group in a topic regex stops them being combined
+    rules = [(1, r"(a)/.*", r"nope"), (2, r"a/b", r"x"), (3, r"(a)/.*", r"x")]
+    m = IgnoreMatcher(rules)
+    assert m.combined is None
+    assert m.match("a/b", "x") == 2
@@ -0,0 +1,31 @@
+from dorcas.worker.voice import split_utterance
+
+
+def test_splits_sentences():
+    assert split_utterance("Hello there. How are you? Fine!") == ["Hello there.", "How are you?", "Fine!"]
+
+
+def test_no_split_after_abbreviations():
+    assert split_utterance("Mr. Smith met Dr. Jones. They talked.") == ["Mr. Smith met Dr. Jones.", "They talked."]
+    assert split_utterance("Bring tools, e.g. a hammer. Thanks.") == ["Bring tools, e.g. a hammer.", "Thanks."]
+
+
+def test_no_split_after_initials():
+    assert split_utterance("Ask J. R. Hartley. He knows.") == ["Ask J. R. Hartley.", "He knows."]
+
+
+def test_strips_input():
+    assert split_utterance("  Hello.  ") == ["Hello."]
+
+
+def test_empty_text():
+    assert split_utterance("") == []
+    assert split_utterance("   \n\t ") == []
+
+
+def test_long_sentence_split_into_clauses():
+    text = ", ".join(["this is a fairly long clause"] * 6) + "."
+    chunks = split_utterance(text, max_length=80)
+    assert len(chunks) > 1
+    assert all(len(x) <= 80 for x in chunks)
+    assert " ".join(chunks) == text